@@ -1,34 +1,93 @@
 import os
-import webbrowser
-from datetime import datetime
-from flask import Flask, render_template, redirect, url_for, flash, request, jsonify, session
+import io
+import mimetypes
+import hmac
+import click
+import time
+from datetime import date
+from flask import Flask, Blueprint, current_app, render_template, redirect, url_for, flash, request, jsonify, session, stream_with_context, g, send_file
+from flask.sessions import SecureCookieSessionInterface
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import Date
-import random
 import json
 
 from config import Config
 from database import init_db, db_session
-from models import User, Devotee, Visit, Item
+from models import User, Devotee, Item, PrintJob
 from forms import LoginForm, DevoteeForm, DevoteeIDForm, AdminSetupForm
-from utils.printer import generate_prn_template
-from utils.report_generator import generate_report
-
-app = Flask(__name__)
-app.config.from_object(Config)
+from utils import metrics
+from utils.analytics import visit_snapshot
+from utils.archive import archive_visits
+from utils.assets import asset_manifest, asset_url, asset_urls, build_assets, find_asset
+from utils.checkin import check_in_devotees, record_offline_checkins
+from utils.checkin_committer import get_checkin_committer
+from utils.devotee_index import devotee_index
+from utils.devotee_io import FORMATS as IMPORT_FORMATS, read_records, import_devotees, export_devotees, export_visits
+from utils.devotee_list import list_devotees, count_devotees
+from utils.item_catalog import item_catalog
+from utils.label_tickets import get_label
+from utils.printer import generate_prn_batch
+from utils.print_spooler import enqueue_print_jobs, get_print_spooler, print_job_to_dict
+from utils.query_plans import check_query_plans
+from utils.report_cache import report_cache, cached_report, cached_dashboard_report, invalidate_reports
+from utils.report_generator import generate_visit_totals, dashboard_version
+from utils.sync import list_changes
+from utils.rollup import rebuild_rollup, ensure_rollup
+from utils.user_cache import user_cache
+from utils.visit_counters import reconcile_visit_counters
+from utils.visit_history import iter_visit_history
 
 # Initialize login manager
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+login_manager.login_view = 'main.login'
+
+# Routes and CLI commands, registered on the app by create_app()
+main = Blueprint('main', __name__, cli_group=None)
+
+# Content types of the CSV and JSON Lines exports
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson'
+}
+
+class SessionInterface(SecureCookieSessionInterface):
+    """
+    Cookie sessions, left out of the fingerprinted asset responses.
+    
+    Reading the session adds Vary: Cookie, which would keep shared caches
+    from storing the public, immutable bundles.
+    """
+    
+    def save_session(self, app, session, response):
+        if request.endpoint == 'main.asset':
+            return
+        super().save_session(app, session, response)
+
+def create_app(config_object=Config):
+    """
+    Create the Flask application.
+    
+    Creating the app does no database work, so that server workers boot
+    quickly. Create the schema and the default items once beforehand with
+    `flask --app app init-db`.
+    
+    Args:
+        config_object: Object whose upper-case attributes are loaded as config
+    
+    Returns:
+        Flask: The application
+    """
+    app = Flask(__name__)
+    app.config.from_object(config_object)
+    app.session_interface = SessionInterface()
+    login_manager.init_app(app)
+    app.register_blueprint(main)
+    app.teardown_appcontext(shutdown_session)
+    return app
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
-
-# Initialize the database
-init_db()
+    return user_cache.get(int(user_id))
 
 # Insert default items if they don't exist
 def initialize_items():
@@ -44,22 +103,31 @@ def initialize_items():
             db_session.add(item)
         db_session.commit()
 
+def initialize_database():
+    """
+    Create the schema, apply pending migrations, add the default items and
+    backfill the report rollup of an upgraded database.
+    """
+    init_db()
+    initialize_items()
+    ensure_rollup()
+
 # Initialize app activation status
 def check_app_activated():
-    return User.query.filter_by(is_admin=True).first() is not None
+    return user_cache.is_activated()
 
 # Routes
-@app.route('/')
+@main.route('/')
 def index():
     if not check_app_activated():
-        return redirect(url_for('admin_setup'))
-    return render_template('home.html', app_activated=check_app_activated())
+        return redirect(url_for('main.admin_setup'))
+    return render_template('home.html', app_activated=True)
 
-@app.route('/admin_setup', methods=['GET', 'POST'])
+@main.route('/admin_setup', methods=['GET', 'POST'])
 def admin_setup():
     if check_app_activated():
         flash('Application is already activated', 'info')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
     form = AdminSetupForm()
     if form.validate_on_submit():
@@ -73,13 +141,13 @@ def admin_setup():
         db_session.add(admin)
         db_session.commit()
         flash('Admin account created! Application activated.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     return render_template('admin_setup.html', form=form)
 
-@app.route('/login', methods=['GET', 'POST'])
+@main.route('/login', methods=['GET', 'POST'])
 def login():
     if not check_app_activated():
-        return redirect(url_for('admin_setup'))
+        return redirect(url_for('main.admin_setup'))
     
     form = LoginForm()
     if form.validate_on_submit():
@@ -88,95 +156,192 @@ def login():
             login_user(user)
             next_page = request.args.get('next')
             flash('Login successful!', 'success')
-            return redirect(next_page or url_for('index'))
+            return redirect(next_page or url_for('main.index'))
         flash('Invalid username or password', 'danger')
     return render_template('login.html', form=form)
 
-@app.route('/logout')
+@main.route('/logout')
 @login_required
 def logout():
     logout_user()
     flash('You have been logged out', 'info')
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-@app.route('/devotee', methods=['GET', 'POST'])
+@main.route('/devotee', methods=['GET', 'POST'])
 def devotee():
     if not check_app_activated():
-        return redirect(url_for('admin_setup'))
+        return redirect(url_for('main.admin_setup'))
     
     form = DevoteeIDForm()
     if form.validate_on_submit():
         devotee_id = form.devotee_id.data
-        devotee = Devotee.query.filter_by(devotee_id=devotee_id).first()
+        result = check_in_devotees([devotee_id])[0]
         
-        if not devotee:
+        if result['status'] != 'ok':
             flash('Devotee ID not found!', 'danger')
-            return redirect(url_for('devotee'))
-        
-        # Get a random item
-        all_items = Item.query.all()
-        selected_item = random.choice(all_items)
-        
-        # Record the visit
-        visit = Visit(
-            devotee_id=devotee.id,
-            item_id=selected_item.id,
-            visit_date=datetime.now()
-        )
-        db_session.add(visit)
-        db_session.commit()
+            return redirect(url_for('main.devotee'))
         
-        # Generate PRN template for the selected item
-        prn_data = {
-            'devotee_id': devotee_id,
-            'devotee_name': devotee.name,
-            'item': selected_item.name,
-            'date': datetime.now().strftime('%Y-%m-%d')
-        }
-        prn_template = generate_prn_template(prn_data)
+        # Only the label ID goes into the session, the label stays server-side
+        session['label_id'] = result['label_id']
         
-        # Store data in session for display
-        session['print_data'] = {
-            'devotee_id': devotee_id,
-            'devotee_name': devotee.name,
-            'item': selected_item.name,
-            'date': datetime.now().strftime('%Y-%m-%d'),
-            'prn_template': prn_template
-        }
-        
-        return render_template('devotee.html', form=form, print_data=session['print_data'])
+        print_data = get_label(result['label_id'])
+        return render_template('devotee.html', form=form, print_data=print_data, label_id=result['label_id'])
     
-    print_data = session.get('print_data', None)
-    return render_template('devotee.html', form=form, print_data=print_data)
+    label_id = session.get('label_id')
+    print_data = get_label(label_id)
+    return render_template('devotee.html', form=form, print_data=print_data, label_id=label_id)
 
-@app.route('/dashboard')
-@login_required
-def dashboard():
-    devotees = Devotee.query.all()
-    total_visits = Visit.query.count()
+@main.route('/api/labels/<label_id>')
+def get_label_data(label_id):
+    print_data = get_label(label_id)
+    if not print_data:
+        return jsonify({'error': 'Label not found or expired'}), 404
+    return jsonify(print_data)
+
+@main.route('/api/checkin', methods=['POST'])
+def api_checkin():
+    if not check_app_activated():
+        return jsonify({'error': 'Application is not activated'}), 403
+    
+    payload = request.get_json(silent=True) or {}
+    devotee_id = payload.get('devotee_id')
+    if not isinstance(devotee_id, str) or not devotee_id.strip():
+        return jsonify({'error': 'devotee_id must be a non-empty string'}), 400
+    
+    # Concurrent check-ins are committed together by the committer thread
+    try:
+        result = get_checkin_committer().check_in(devotee_id.strip())
+    except TimeoutError:
+        return jsonify({'error': 'Check-in timed out, please retry'}), 503
+    except Exception:
+        # E.g. the database was locked, the committer has logged the error
+        return jsonify({'error': 'Check-in failed, please retry'}), 503
+    
+    if result['status'] != 'ok':
+        return jsonify({'error': 'Devotee ID not found', 'devotee_id': devotee_id}), 404
+    return jsonify({key: value for key, value in result.items() if key != 'status'})
+
+@main.route('/api/checkins', methods=['POST'])
+def batch_checkin():
+    if not check_app_activated():
+        return jsonify({'error': 'Application is not activated'}), 403
+    
+    payload = request.get_json(silent=True) or {}
+    devotee_ids = payload.get('devotee_ids')
+    if not isinstance(devotee_ids, list) or not all(isinstance(i, str) for i in devotee_ids):
+        return jsonify({'error': 'devotee_ids must be a list of strings'}), 400
+    if len(devotee_ids) > current_app.config['CHECKIN_BATCH_LIMIT']:
+        return jsonify({'error': f"At most {current_app.config['CHECKIN_BATCH_LIMIT']} devotee IDs per request"}), 400
+    
+    results = check_in_devotees([devotee_id.strip() for devotee_id in devotee_ids])
+    
+    checked_in = [result for result in results if result['status'] == 'ok']
     
-    # Get daily visits
-    today = datetime.now().date()
-    daily_visits = Visit.query.filter(Visit.visit_date.cast(Date) == today).count()
+    return jsonify({
+        'checked_in': len(checked_in),
+        'results': results,
+        # All labels as one printer job
+        'prn_batch': generate_prn_batch(checked_in).decode('utf-8')
+    })
+
+@main.route('/api/sync/checkins', methods=['POST'])
+def sync_checkins():
+    if not check_app_activated():
+        return jsonify({'error': 'Application is not activated'}), 403
+    
+    payload = request.get_json(silent=True) or {}
+    checkins = payload.get('checkins')
+    if not isinstance(checkins, list):
+        return jsonify({'error': 'checkins must be a list'}), 400
+    if len(checkins) > current_app.config['CHECKIN_BATCH_LIMIT']:
+        return jsonify({'error': f"At most {current_app.config['CHECKIN_BATCH_LIMIT']} check-ins per request"}), 400
+    
+    # Idempotent by client_id, so kiosks can simply retry failed uploads
+    results = record_offline_checkins(checkins)
+    
+    return jsonify({
+        'recorded': sum(1 for result in results if result['status'] == 'ok'),
+        'results': results
+    })
+
+@main.route('/api/sync/changes')
+def sync_changes():
+    # Kiosks sync without a login session, like they check in
+    if not check_app_activated():
+        return jsonify({'error': 'Application is not activated'}), 403
+    
+    limit = request.args.get('limit', current_app.config['SYNC_PAGE_LIMIT'], type=int)
+    if not 0 < limit <= current_app.config['SYNC_PAGE_LIMIT']:
+        return jsonify({'error': f"limit must be between 1 and {current_app.config['SYNC_PAGE_LIMIT']}"}), 400
+    
+    try:
+        data = list_changes(request.args.get('cursor'), limit=limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(data)
+
+@main.route('/api/print_jobs', methods=['POST'])
+def create_print_jobs():
+    if not check_app_activated():
+        return jsonify({'error': 'Application is not activated'}), 403
+    
+    payload = request.get_json(silent=True) or {}
+    printer = payload.get('printer') or current_app.config['AUTO_PRINT_PRINTER']
+    if printer not in current_app.config['PRINTERS']:
+        return jsonify({'error': 'Unknown printer'}), 400
     
-    # Get monthly visits
-    month_start = datetime(today.year, today.month, 1).date()
-    monthly_visits = Visit.query.filter(Visit.visit_date.cast(Date) >= month_start).count()
+    labels = payload.get('labels')
+    if not isinstance(labels, list) or not labels or not all(isinstance(label, dict) for label in labels):
+        return jsonify({'error': 'labels must be a non-empty list of label objects'}), 400
+    if len(labels) > current_app.config['CHECKIN_BATCH_LIMIT']:
+        return jsonify({'error': f"At most {current_app.config['CHECKIN_BATCH_LIMIT']} labels per request"}), 400
     
-    # Get yearly visits
-    year_start = datetime(today.year, 1, 1).date()
-    yearly_visits = Visit.query.filter(Visit.visit_date.cast(Date) >= year_start).count()
+    job_ids = enqueue_print_jobs(printer, labels)
+    db_session.commit()
+    get_print_spooler().notify()
+    
+    return jsonify({'printer': printer, 'job_ids': job_ids}), 202
+
+@main.route('/api/print_jobs')
+@login_required
+def get_print_jobs():
+    limit = request.args.get('limit', 50, type=int)
+    query = PrintJob.query.order_by(PrintJob.id.desc())
+    if request.args.get('status'):
+        query = query.filter(PrintJob.status == request.args['status'])
+    if request.args.get('printer'):
+        query = query.filter(PrintJob.printer == request.args['printer'])
+    
+    jobs = query.limit(min(max(limit, 1), 200)).all()
+    return jsonify({'jobs': [print_job_to_dict(job) for job in jobs]})
+
+@main.route('/api/print_jobs/<int:job_id>')
+@login_required
+def get_print_job(job_id):
+    job = PrintJob.query.get(job_id)
+    if not job:
+        return jsonify({'error': 'Print job not found'}), 404
+    return jsonify(print_job_to_dict(job))
+
+@main.route('/dashboard')
+@login_required
+def dashboard():
+    # The devotee list itself is fetched page by page from /api/devotees
+    devotee_count = count_devotees()
+    
+    # Total, daily, monthly and yearly visits from the daily rollup
+    totals = generate_visit_totals()
     
     return render_template(
         'dashboard.html',
-        devotees=devotees,
-        total_visits=total_visits,
-        daily_visits=daily_visits,
-        monthly_visits=monthly_visits,
-        yearly_visits=yearly_visits
+        devotee_count=devotee_count,
+        total_visits=totals['total'],
+        daily_visits=totals['daily'],
+        monthly_visits=totals['monthly'],
+        yearly_visits=totals['yearly']
     )
 
-@app.route('/add_devotee', methods=['GET', 'POST'])
+@main.route('/add_devotee', methods=['GET', 'POST'])
 @login_required
 def add_devotee():
     form = DevoteeForm()
@@ -191,47 +356,355 @@ def add_devotee():
         db_session.add(devotee)
         db_session.commit()
         flash('Devotee added successfully!', 'success')
-        return redirect(url_for('add_devotee'))
+        return redirect(url_for('main.add_devotee'))
     return render_template('add_devotee.html', form=form)
 
-@app.route('/api/reports/<report_type>')
+@main.route('/api/dashboard')
+@login_required
+def get_dashboard():
+    # Unchanged dashboards cost two max(id) lookups and an empty 304
+    etag = dashboard_version()
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(cached_dashboard_report(etag))
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@main.route('/api/reports/<report_type>')
 @login_required
 def get_report(report_type):
-    data = generate_report(report_type)
+    try:
+        data = cached_report(report_type, **request.args.to_dict())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     return jsonify(data)
 
-@app.route('/api/devotee/<devotee_id>/visits')
+@main.route('/api/reports/cache_stats')
+@login_required
+def get_report_cache_stats():
+    return jsonify(report_cache.stats())
+
+@main.route('/api/metrics')
+def get_metrics():
+    token = current_app.config['METRICS_TOKEN']
+    authorized = current_user.is_authenticated or (
+        token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    )
+    if not authorized:
+        return jsonify({'error': 'Authentication required'}), 401
+    
+    cache_stats = report_cache.stats()
+    return current_app.response_class(
+        metrics.render_metrics([
+            ('temple_report_cache_hits_total', 'counter', 'Reports served from the cache.', cache_stats['hits']),
+            ('temple_report_cache_misses_total', 'counter', 'Reports computed on a cache miss.', cache_stats['misses']),
+            ('temple_report_cache_invalidations_total', 'counter', 'Cached reports dropped by new visits.', cache_stats['invalidations']),
+            ('temple_report_cache_entries', 'gauge', 'Reports currently cached.', cache_stats['entries']),
+            ('temple_worker_boot_seconds', 'gauge', 'Time the worker took to import and create the app.', current_app.config.get('BOOT_SECONDS', 0))
+        ]),
+        mimetype='text/plain; version=0.0.4'
+    )
+
+@main.route('/assets/<path:filename>')
+def asset(filename):
+    found = find_asset(current_app.static_folder, filename, request.accept_encodings)
+    if found is None:
+        return jsonify({'error': 'Asset not found'}), 404
+    
+    path, encoding = found
+    # The name changes with the content, so browsers never need to revalidate
+    response = send_file(
+        path, mimetype=mimetypes.guess_type(filename)[0], download_name=filename, etag=False, conditional=False
+    )
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = f"public, max-age={current_app.config['ASSETS_MAX_AGE']}, immutable"
+    return response
+
+@main.app_context_processor
+def inject_asset_helpers():
+    return {'asset_url': asset_url, 'asset_urls': asset_urls}
+
+@main.route('/api/devotees')
+@login_required
+def get_devotees():
+    search = request.args.get('q', '').strip() or None
+    after = request.args.get('after')
+    limit = request.args.get('limit', 50, type=int)
+    if not 0 < limit <= current_app.config['DEVOTEES_PAGE_LIMIT']:
+        return jsonify({'error': f"limit must be between 1 and {current_app.config['DEVOTEES_PAGE_LIMIT']}"}), 400
+    
+    data = list_devotees(search=search, after=after, limit=limit)
+    
+    # Only the first page carries the total, later pages reuse it
+    if after is None:
+        data['total'] = count_devotees(search)
+    
+    return jsonify(data)
+
+@main.route('/api/devotees/import', methods=['POST'])
+@login_required
+def import_devotees_api():
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({'error': 'Upload the devotee file as "file"'}), 400
+    
+    fmt = request.form.get('format') or ('jsonl' if upload.filename.endswith(('.jsonl', '.json')) else 'csv')
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(IMPORT_FORMATS)}"}), 400
+    
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    summary = import_devotees(read_records(stream, fmt))
+    # Devotee totals are part of the cached reports
+    invalidate_reports()
+    
+    return jsonify(summary)
+
+@main.route('/api/devotees/export')
+@login_required
+def export_devotees_api():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(IMPORT_FORMATS)}"}), 400
+    
+    return current_app.response_class(
+        stream_with_context(export_devotees(fmt)),
+        mimetype=EXPORT_MIMETYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename=devotees.{fmt}'}
+    )
+
+@main.route('/api/visits/export')
+@login_required
+def export_visits_api():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(IMPORT_FORMATS)}"}), 400
+    try:
+        start = date.fromisoformat(request.args['start']) if 'start' in request.args else None
+        end = date.fromisoformat(request.args['end']) if 'end' in request.args else None
+    except ValueError:
+        return jsonify({'error': 'start and end must be dates (YYYY-MM-DD)'}), 400
+    
+    return current_app.response_class(
+        stream_with_context(export_visits(fmt, start=start, end=end)),
+        mimetype=EXPORT_MIMETYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename=visits.{fmt}'}
+    )
+
+@main.route('/api/devotee/<devotee_id>/visits')
 @login_required
 def get_devotee_visits(devotee_id):
-    devotee = Devotee.query.filter_by(devotee_id=devotee_id).first()
+    devotee = db_session.query(
+        Devotee.id, Devotee.devotee_id, Devotee.name, Devotee.visit_count, Devotee.last_visit_at
+    ).filter_by(devotee_id=devotee_id).first()
     if not devotee:
         return jsonify({'error': 'Devotee not found'}), 404
     
-    visits = Visit.query.filter_by(devotee_id=devotee.id).all()
-    visit_data = []
-    for visit in visits:
-        item = Item.query.get(visit.item_id)
-        visit_data.append({
-            'date': visit.visit_date.strftime('%Y-%m-%d'),
-            'item': item.name if item else 'Unknown'
-        })
+    # Keyset pagination and date filters
+    after = request.args.get('after', type=int)
+    limit = request.args.get('limit', type=int)
+    try:
+        start = date.fromisoformat(request.args['start']) if 'start' in request.args else None
+        end = date.fromisoformat(request.args['end']) if 'end' in request.args else None
+    except ValueError:
+        return jsonify({'error': 'start and end must be dates (YYYY-MM-DD)'}), 400
+    if limit is not None and not 0 < limit <= current_app.config['VISITS_PAGE_LIMIT']:
+        return jsonify({'error': f"limit must be between 1 and {current_app.config['VISITS_PAGE_LIMIT']}"}), 400
     
-    return jsonify({
-        'devotee': {
+    visits = iter_visit_history(devotee.id, after=after, start=start, end=end, limit=limit)
+    
+    def generate():
+        # Stream the visits in chunks so memory stays flat for long histories
+        yield '{"devotee": %s, "visits": [' % json.dumps({
             'id': devotee.devotee_id,
-            'name': devotee.name
-        },
-        'visits': visit_data
-    })
+            'name': devotee.name,
+            'visit_count': devotee.visit_count,
+            'last_visit': devotee.last_visit_at.strftime('%Y-%m-%d') if devotee.last_visit_at else None
+        })
+        
+        count = 0
+        last_id = None
+        chunk = []
+        for visit_id, visit_date, item_id in visits:
+            chunk.append(json.dumps({
+                'id': visit_id,
+                'date': visit_date.strftime('%Y-%m-%d'),
+                'item': item_catalog.name(item_id)
+            }))
+            count += 1
+            last_id = visit_id
+            if len(chunk) == 500:
+                yield (',' if count > len(chunk) else '') + ','.join(chunk)
+                chunk = []
+        if chunk:
+            yield (',' if count > len(chunk) else '') + ','.join(chunk)
+        
+        # Only a full page can have more visits after it
+        next_after = last_id if limit is not None and count == limit else None
+        yield '], "next_after": %s}' % json.dumps(next_after)
+    
+    return current_app.response_class(stream_with_context(generate()), mimetype='application/json')
+
+@main.cli.command('init-db')
+def init_db_command():
+    """Create or upgrade the database schema and add the default items."""
+    started = time.perf_counter()
+    initialize_database()
+    click.echo(f'Database ready in {time.perf_counter() - started:.2f}s')
+
+@main.cli.command('rebuild-rollup')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Only rebuild days on or after this date (YYYY-MM-DD).')
+def rebuild_rollup_command(since):
+    """Rebuild the visit_daily_rollup table from the visits table."""
+    rows = rebuild_rollup(since.date() if since else None)
+    invalidate_reports()
+    click.echo(f'Rebuilt visit rollup: {rows} rows written')
+
+@main.cli.command('archive-visits')
+@click.option('--before', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Archive visits before this date (YYYY-MM-DD), defaults to ARCHIVE_AFTER_DAYS ago.')
+def archive_visits_command(before):
+    """Move old visits into per-year archive files in ARCHIVE_DIR."""
+    def report(year, month, count):
+        if count:
+            click.echo(f'  {month:%Y-%m}: {count} visits')
+    
+    try:
+        summary = archive_visits(before.date() if before else None, progress=report)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    
+    visit_snapshot.invalidate()
+    invalidate_reports()
+    for year, count in summary['years'].items():
+        if count:
+            click.echo(f'Archived {count} visits of {year}')
+    click.echo(f"Visits before {summary['before']} are archived")
+
+@main.cli.command('reconcile-visit-counters')
+@click.option('--chunk-size', default=1000, show_default=True, help='Devotees checked per transaction.')
+def reconcile_visit_counters_command(chunk_size):
+    """Recompute the devotees' visit counters from the visits and archives."""
+    corrected = reconcile_visit_counters(chunk_size=chunk_size)
+    invalidate_reports()
+    click.echo(f'Corrected the visit counters of {corrected} devotees')
+
+@main.cli.command('build-assets')
+def build_assets_command():
+    """Bundle, minify and precompress the static scripts and stylesheet."""
+    manifest = build_assets(current_app.static_folder)
+    asset_manifest.invalidate()
+    for bundle, filename in manifest['files'].items():
+        click.echo(f'{bundle} -> dist/{filename}')
+
+@main.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Check that the hot report and history queries use their indexes."""
+    failed = False
+    for check in check_query_plans():
+        status = 'OK' if check['ok'] else 'FAIL'
+        click.echo(f"[{status}] {check['name']} (expects {check['index']})")
+        for detail in check['plan']:
+            click.echo(f'    {detail}')
+        failed = failed or not check['ok']
+    
+    if failed:
+        raise SystemExit(1)
+
+@main.cli.command('import-devotees')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(IMPORT_FORMATS), default=None,
+              help='File format, guessed from the extension by default.')
+@click.option('--chunk-size', default=1000, show_default=True, help='Devotees inserted per transaction.')
+def import_devotees_command(path, fmt, chunk_size):
+    """Import devotees from a CSV or JSON Lines file."""
+    fmt = fmt or ('jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+    
+    def report(summary):
+        click.echo(f"  read {summary['read']}, imported {summary['imported']}, "
+                   f"duplicates {summary['duplicates']}, invalid {summary['invalid']}")
+    
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        summary = import_devotees(read_records(f, fmt), chunk_size=chunk_size, progress=report)
+    invalidate_reports()
+    
+    for error in summary['errors']:
+        click.echo(f"  line {error['line']}: {error['error']}")
+    click.echo(f"Imported {summary['imported']} devotees")
+
+@main.cli.command('export-devotees')
+@click.option('--format', 'fmt', type=click.Choice(IMPORT_FORMATS), default='csv', show_default=True)
+@click.option('--output', type=click.File('w'), default='-', help='Output file, stdout by default.')
+def export_devotees_command(fmt, output):
+    """Export all devotees as CSV or JSON Lines."""
+    for chunk in export_devotees(fmt):
+        output.write(chunk)
+
+@main.cli.command('export-visits')
+@click.option('--format', 'fmt', type=click.Choice(IMPORT_FORMATS), default='csv', show_default=True)
+@click.option('--output', type=click.File('w'), default='-', help='Output file, stdout by default.')
+@click.option('--start', type=click.DateTime(formats=['%Y-%m-%d']), default=None)
+@click.option('--end', type=click.DateTime(formats=['%Y-%m-%d']), default=None)
+def export_visits_command(fmt, output, start, end):
+    """Export visits as CSV or JSON Lines."""
+    for chunk in export_visits(fmt, start=start.date() if start else None, end=end.date() if end else None):
+        output.write(chunk)
+
+@main.cli.command('print-spooler')
+def print_spooler_command():
+    """Run the print spooler workers until interrupted."""
+    spooler = get_print_spooler()
+    if not spooler.printers:
+        raise click.ClickException('No printers configured, set PRINTERS (e.g. "default=tcp://10.0.0.5:9100")')
+    
+    spooler.start()
+    click.echo(f"Print spooler running for: {', '.join(spooler.printers)}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        spooler.stop()
+
+@main.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    metrics.start_request()
+
+@main.after_app_request
+def record_request_timing(response):
+    # Streamed responses are timed up to the first byte
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    
+    seconds = time.perf_counter() - started
+    queries, db_time = metrics.finish_request(
+        request.method, request.endpoint or 'unmatched', response.status_code, seconds
+    )
+    response.headers['Server-Timing'] = (
+        f'app;dur={seconds * 1000:.1f}, db;dur={db_time * 1000:.1f};desc="{queries} queries"'
+    )
+    return response
 
-@app.teardown_appcontext
 def shutdown_session(exception=None):
     db_session.remove()
 
 if __name__ == '__main__':
-    # Initialize items on startup
-    initialize_items()
+    # Development server; in production serve wsgi:app with several workers
+    app = create_app()
+    with app.app_context():
+        initialize_database()
+        devotee_index.load()
+    # Start the print spooler in the serving process (not the reloader's parent)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        get_print_spooler().start()
     # Open the browser automatically
+    import webbrowser
     webbrowser.open('http://localhost:5000')
     # Run the app
     app.run(host='0.0.0.0', port=5000, debug=True)
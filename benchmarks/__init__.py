@@ -0,0 +1,6 @@
+"""
+Benchmarks for the check-in, report, dashboard and visit history endpoints
+
+Run with:
+    python -m benchmarks.run --help
+"""
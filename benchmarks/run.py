@@ -0,0 +1,293 @@
+"""
+Benchmark the web endpoints against a seeded database
+
+Seeds a fresh SQLite database (or reuses one with --reuse), then drives the
+app through the Flask test client from one thread per concurrency level
+and reports throughput and latency percentiles per scenario. Results are
+printed as a table and can be written as JSON and compared to an earlier
+run with --compare.
+
+    python -m benchmarks.run --devotees 5000 --years 5 --concurrency 1,4,8 --output bench.json
+    python -m benchmarks.run --compare bench.json
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+REPORT_TYPES = ['daily', 'monthly', 'yearly', 'devotees', 'items']
+# Reports computed with NumPy, only benchmarked when it is installed
+ANALYTICS_REPORT_TYPES = ['heatmap', 'retention', 'item_distribution']
+TIMESERIES_GRANULARITIES = ['day', 'week', 'month', 'year']
+
+# A scenario slower than the baseline by more than this factor is flagged
+REGRESSION_THRESHOLD = 1.2
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the temple management endpoints.')
+    parser.add_argument('--db', help='SQLite database file, a temporary file by default')
+    parser.add_argument('--reuse', action='store_true', help='Use the existing data in --db instead of seeding')
+    parser.add_argument('--devotees', type=int, default=1000, help='Number of devotees to seed')
+    parser.add_argument('--years', type=int, default=3, help='Years of visit history to seed')
+    parser.add_argument('--visits-per-day', type=int, default=100, help='Average visits per day to seed')
+    parser.add_argument('--items', type=int, default=18, help='Number of items to seed')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    parser.add_argument('--concurrency', default='1,4', help='Comma-separated numbers of concurrent clients')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per scenario and concurrency level')
+    parser.add_argument('--scenarios', help='Comma-separated scenario name prefixes to run, all by default')
+    parser.add_argument('--no-report-cache', action='store_true', help='Compute every report instead of serving it from the cache')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Compare the results to an earlier JSON output')
+    return parser.parse_args(argv)
+
+def build_scenarios(devotee_ids):
+    """
+    Build the benchmark scenarios.
+    
+    Args:
+        devotee_ids (list): Devotee IDs to check in and look up
+    
+    Returns:
+        list: (name, request function) pairs; the function takes a test
+            client and a random.Random and returns the response
+    """
+    scenarios = [
+        ('checkin', lambda client, rng: client.post('/devotee', data={'devotee_id': rng.choice(devotee_ids)})),
+        ('api_checkin', lambda client, rng: client.post('/api/checkin', json={'devotee_id': rng.choice(devotee_ids)})),
+        ('dashboard', lambda client, rng: client.get('/dashboard')),
+        ('api_dashboard', lambda client, rng: client.get('/api/dashboard')),
+    ]
+    
+    report_types = list(REPORT_TYPES)
+    if importlib.util.find_spec('numpy') is not None:
+        report_types += ANALYTICS_REPORT_TYPES
+    for report_type in report_types:
+        scenarios.append((
+            f'report:{report_type}',
+            lambda client, rng, report_type=report_type: client.get(f'/api/reports/{report_type}')
+        ))
+    for granularity in TIMESERIES_GRANULARITIES:
+        scenarios.append((
+            f'report:timeseries:{granularity}',
+            lambda client, rng, granularity=granularity: client.get(
+                '/api/reports/timeseries', query_string={'granularity': granularity}
+            )
+        ))
+    
+    scenarios.append((
+        'visits',
+        lambda client, rng: client.get(f'/api/devotee/{rng.choice(devotee_ids)}/visits', query_string={'limit': 100})
+    ))
+    return scenarios
+
+def run_scenario(app, login, request, concurrency, total_requests, seed):
+    """
+    Send requests from several threads at once and measure them.
+    
+    Args:
+        app: The Flask app
+        login (callable): Logs a test client in
+        request (callable): Sends one request, see build_scenarios()
+        concurrency (int): Number of threads sending requests
+        total_requests (int): Number of requests over all threads
+        seed (int): Random seed for the request parameters
+    
+    Returns:
+        dict: Throughput, error count and latency percentiles in milliseconds
+    """
+    from database import db_session
+    
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(concurrency + 1)
+    per_thread = [total_requests // concurrency + (1 if i < total_requests % concurrency else 0) for i in range(concurrency)]
+    
+    def worker(index):
+        client = app.test_client()
+        login(client)
+        rng = random.Random(seed + index)
+        own_latencies = []
+        own_errors = []
+        start_barrier.wait()
+        for _ in range(per_thread[index]):
+            started = time.perf_counter()
+            try:
+                response = request(client, rng)
+                response.get_data()
+                if response.status_code >= 400:
+                    own_errors.append(f'HTTP {response.status_code}')
+            except Exception as e:
+                own_errors.append(str(e))
+            own_latencies.append(time.perf_counter() - started)
+        db_session.remove()
+        with lock:
+            latencies.extend(own_latencies)
+            errors.extend(own_errors)
+    
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    
+    latencies.sort()
+    
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 3)
+    
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'error_samples': sorted(set(errors))[:5],
+        'seconds': round(elapsed, 3),
+        'throughput': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'mean': round(statistics.fmean(latencies) * 1000, 3),
+            'p50': percentile(0.50),
+            'p95': percentile(0.95),
+            'p99': percentile(0.99),
+            'max': round(latencies[-1] * 1000, 3)
+        }
+    }
+
+def compare_results(results, baseline):
+    """
+    Compare p50 latencies with an earlier run.
+    
+    Returns:
+        list: (scenario, concurrency, baseline p50, p50, ratio) for every
+            scenario found in both runs
+    """
+    previous = {
+        (result['scenario'], result['concurrency']): result['latency_ms']['p50']
+        for result in baseline['results']
+    }
+    comparison = []
+    for result in results:
+        key = (result['scenario'], result['concurrency'])
+        if key in previous and previous[key]:
+            p50 = result['latency_ms']['p50']
+            comparison.append((key[0], key[1], previous[key], p50, round(p50 / previous[key], 2)))
+    return comparison
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.reuse and not args.db:
+        sys.exit('--reuse needs --db')
+    
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='temple-bench-'), 'bench.db')
+    if not args.reuse and os.path.exists(db_path):
+        sys.exit(f'{db_path} already exists, pass --reuse to benchmark its data')
+    
+    # The engine is created from DATABASE_URL on import, so set it first
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(db_path)}'
+    
+    import sqlalchemy
+    from benchmarks.seed import seed_database, BENCHMARK_USER, BENCHMARK_PASSWORD
+    from database import db_session
+    from models import Devotee, User
+    
+    seeded = None
+    if not args.reuse:
+        started = time.perf_counter()
+        seeded = seed_database(
+            devotees=args.devotees,
+            years=args.years,
+            visits_per_day=args.visits_per_day,
+            items=args.items,
+            seed=args.seed
+        )
+        print(f"Seeded {seeded['devotees']} devotees and {seeded['visits']} visits "
+              f"in {time.perf_counter() - started:.1f}s ({db_path})")
+    
+    from app import create_app
+    from utils.report_cache import report_cache
+    
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    if args.no_report_cache:
+        report_cache.ttl = 0
+    
+    if User.query.filter_by(username=BENCHMARK_USER).first() is None:
+        sys.exit(f'{db_path} has no {BENCHMARK_USER} user, it was not seeded by this benchmark')
+    devotee_ids = [devotee_id for devotee_id, in db_session.query(Devotee.devotee_id)]
+    db_session.remove()
+    
+    def login(client):
+        response = client.post('/login', data={'username': BENCHMARK_USER, 'password': BENCHMARK_PASSWORD})
+        if response.status_code != 302:
+            raise RuntimeError(f'Login failed with HTTP {response.status_code}')
+    
+    scenarios = build_scenarios(devotee_ids)
+    if args.scenarios:
+        prefixes = args.scenarios.split(',')
+        scenarios = [(name, request) for name, request in scenarios if name.startswith(tuple(prefixes))]
+    
+    concurrency_levels = [int(level) for level in args.concurrency.split(',')]
+    results = []
+    print(f"{'scenario':<28}{'conc':>5}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, request in scenarios:
+        for concurrency in concurrency_levels:
+            result = run_scenario(app, login, request, concurrency, args.requests, args.seed)
+            result['scenario'] = name
+            results.append(result)
+            latency = result['latency_ms']
+            print(f"{name:<28}{concurrency:>5}{result['throughput']:>10}{latency['p50']:>10}"
+                  f"{latency['p95']:>10}{latency['p99']:>10}{result['errors']:>8}")
+    
+    output = {
+        'run_at': datetime.now().isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'sqlalchemy': sqlalchemy.__version__,
+            'platform': platform.platform()
+        },
+        'parameters': {
+            'devotees': args.devotees,
+            'years': args.years,
+            'visits_per_day': args.visits_per_day,
+            'items': args.items,
+            'seed': args.seed,
+            'requests': args.requests,
+            'report_cache': not args.no_report_cache,
+            'reused_db': args.reuse
+        },
+        'seeded': seeded,
+        'results': results
+    }
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+        print(f'Results written to {args.output}')
+    
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\n{'scenario':<28}{'conc':>5}{'base p50':>10}{'p50':>10}{'ratio':>8}")
+        regressions = 0
+        for name, concurrency, previous, p50, ratio in compare_results(results, baseline):
+            flag = '  slower' if ratio > REGRESSION_THRESHOLD else ''
+            regressions += bool(flag)
+            print(f'{name:<28}{concurrency:>5}{previous:>10}{p50:>10}{ratio:>8}{flag}')
+        if regressions:
+            print(f'{regressions} scenario(s) more than {REGRESSION_THRESHOLD}x slower than the baseline')
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+Seed a database with synthetic devotees, items and visits
+
+Must be imported after DATABASE_URL points at the benchmark database, as
+the engine is created from it on import.
+"""
+
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+
+from database import init_db, db_session
+from models import User, Devotee, Item, Visit
+from utils.rollup import rebuild_rollup
+from utils.visit_counters import reconcile_visit_counters
+
+BENCHMARK_USER = 'bench'
+BENCHMARK_PASSWORD = 'bench-password'
+
+def seed_database(devotees=1000, years=3, visits_per_day=100, items=18, seed=42, chunk_size=10000):
+    """
+    Fill an empty database with synthetic data.
+    
+    Args:
+        devotees (int): Number of devotees
+        years (int): Number of years of visit history, ending today
+        visits_per_day (int): Average number of visits per day
+        items (int): Number of items
+        seed (int): Random seed, so runs with the same volumes are comparable
+        chunk_size (int): Number of visits inserted per statement
+    
+    Returns:
+        dict: The number of rows created per table
+    """
+    init_db()
+    rng = random.Random(seed)
+    
+    db_session.add(User(
+        username=BENCHMARK_USER,
+        email='bench@example.com',
+        password=generate_password_hash(BENCHMARK_PASSWORD),
+        is_admin=True
+    ))
+    db_session.execute(insert(Item), [
+        {'name': f'Prasad {i}', 'description': f'Prasad item {i}'}
+        for i in range(1, items + 1)
+    ])
+    db_session.execute(insert(Devotee), [
+        {'devotee_id': f'B{i:06d}', 'name': f'Devotee {i}', 'phone': f'9{i:09d}'}
+        for i in range(1, devotees + 1)
+    ])
+    db_session.commit()
+    
+    # Visits arrive throughout the day, with a weekly rhythm and some noise
+    now = datetime.now()
+    first_day = (now - timedelta(days=365 * years)).replace(hour=0, minute=0, second=0, microsecond=0)
+    visits = []
+    total_visits = 0
+    day = first_day
+    while day <= now:
+        weekend = 1.5 if day.weekday() >= 5 else 1.0
+        for _ in range(max(0, int(rng.gauss(visits_per_day * weekend, visits_per_day * 0.1)))):
+            visit_date = day + timedelta(seconds=rng.randint(6 * 3600, 21 * 3600))
+            if visit_date > now:
+                continue
+            visits.append({
+                'devotee_id': rng.randint(1, devotees),
+                'item_id': rng.randint(1, items),
+                'visit_date': visit_date
+            })
+            if len(visits) >= chunk_size:
+                db_session.execute(insert(Visit), visits)
+                total_visits += len(visits)
+                visits = []
+        day += timedelta(days=1)
+    
+    if visits:
+        db_session.execute(insert(Visit), visits)
+        total_visits += len(visits)
+    db_session.commit()
+    
+    rebuild_rollup()
+    reconcile_visit_counters()
+    db_session.remove()
+    
+    return {'users': 1, 'items': items, 'devotees': devotees, 'visits': total_visits}
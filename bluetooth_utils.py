@@ -7,6 +7,8 @@ This file provides support functions for that approach.
 
 import logging
 
+from utils.printer import compile_template
+
 logger = logging.getLogger(__name__)
 
 def get_connection_status():
@@ -24,11 +26,8 @@ def format_printer_command(prn_template, data):
     Format a printer command based on the template and data
     """
     try:
-        formatted_command = prn_template
-        for key, value in data.items():
-            placeholder = f"{{{key}}}"
-            formatted_command = formatted_command.replace(placeholder, str(value))
-        return formatted_command
+        # The template is parsed once and reused for every label
+        return compile_template(prn_template).render_text(data)
     except Exception as e:
         logger.error(f"Error formatting printer command: {e}")
         return None
@@ -5,12 +5,88 @@ class Config:
     # Generate a random secret key if not provided
     SECRET_KEY = os.environ.get('SECRET_KEY', secrets.token_hex(16))
     
-    # Database settings
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///temple_management.db'
+    # Database settings, DATABASE_URL may point at a server database instead
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///temple_management.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Connection pool sized for multi-threaded serving
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    
+    # PRAGMAs applied to every new SQLite connection. WAL lets check-in
+    # writers and dashboard readers work concurrently, busy_timeout (ms) makes
+    # writers wait for the lock instead of failing with "database is locked".
+    SQLITE_PRAGMAS = {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),
+        'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64000)),
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 268435456)),
+        'temp_store': 'MEMORY'
+    }
+    
     # App settings
     APP_NAME = "Temple Management System"
     
     # Items to be selected randomly
     ITEMS_COUNT = 18
+    
+    # Maximum number of devotee IDs accepted by one batch check-in request
+    CHECKIN_BATCH_LIMIT = 500
+    
+    # Group commit for /api/checkin: most check-ins recorded per transaction,
+    # and how long (ms) the committer waits for more to join a batch
+    CHECKIN_GROUP_SIZE = int(os.environ.get('CHECKIN_GROUP_SIZE', 100))
+    CHECKIN_GROUP_WAIT_MS = float(os.environ.get('CHECKIN_GROUP_WAIT_MS', 0))
+    
+    # Maximum page size for the devotee visit history API
+    VISITS_PAGE_LIMIT = 1000
+    
+    # Maximum page size for the devotee list API
+    DEVOTEES_PAGE_LIMIT = 200
+    
+    # Maximum number of devotees per page of the delta sync API
+    SYNC_PAGE_LIMIT = 5000
+    
+    # Server-side print spooler. PRINTERS maps printer names to targets, given
+    # as "name=url,..." where url is tcp://host:port for a raw network printer
+    # or file:///path/to/file to append jobs to a file.
+    PRINTERS = dict(
+        entry.split('=', 1) for entry in os.environ.get('PRINTERS', '').split(',') if '=' in entry
+    )
+    PRINT_WORKERS = int(os.environ.get('PRINT_WORKERS', 2))
+    PRINT_MAX_ATTEMPTS = int(os.environ.get('PRINT_MAX_ATTEMPTS', 3))
+    PRINT_POLL_INTERVAL = float(os.environ.get('PRINT_POLL_INTERVAL', 1.0))
+    PRINT_BATCH_SIZE = int(os.environ.get('PRINT_BATCH_SIZE', 50))
+    
+    # Seconds a check-in label stays available for display and reprinting
+    LABEL_TICKET_TTL = int(os.environ.get('LABEL_TICKET_TTL', 3600))
+    
+    # Printer to queue a label on for every check-in, None to leave printing to the client
+    AUTO_PRINT_PRINTER = os.environ.get('AUTO_PRINT_PRINTER')
+    
+    # Report result cache: number of cached reports and their lifetime in seconds
+    REPORT_CACHE_SIZE = int(os.environ.get('REPORT_CACHE_SIZE', 128))
+    REPORT_CACHE_TTL = int(os.environ.get('REPORT_CACHE_TTL', 60))
+    
+    # Visits older than ARCHIVE_AFTER_DAYS are moved by `flask archive-visits`
+    # into one SQLite file per year in ARCHIVE_DIR
+    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', 'archive')
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 730))
+    
+    # Lifetime in seconds of the fingerprinted static bundles in browser caches
+    ASSETS_MAX_AGE = int(os.environ.get('ASSETS_MAX_AGE', 31536000))
+    
+    # Seconds a logged-in user is cached between requests before being reloaded
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+    
+    # Load the item catalog and devotee index when wsgi.py is imported instead of on first use
+    WARM_CACHES = os.environ.get('WARM_CACHES', '').lower() in ('1', 'true', 'yes')
+    
+    # Queries taking at least this many milliseconds are logged as slow
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 250))
+    
+    # Bearer token for scraping /api/metrics without logging in, unset to require a login
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
@@ -1,9 +1,62 @@
-from sqlalchemy import create_engine
+import logging
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from config import Config
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+def _engine_options(url):
+    """
+    Build the create_engine() keyword arguments for a database URL.
+    """
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        # In-memory SQLite keeps its own single-connection pool
+        return {}
+    
+    options = {
+        'pool_size': Config.DB_POOL_SIZE,
+        'max_overflow': Config.DB_MAX_OVERFLOW,
+        'pool_timeout': Config.DB_POOL_TIMEOUT
+    }
+    if url.get_backend_name() != 'sqlite':
+        options['pool_recycle'] = Config.DB_POOL_RECYCLE
+        options['pool_pre_ping'] = True
+    return options
+
+database_url = make_url(Config.SQLALCHEMY_DATABASE_URI)
+engine = create_engine(database_url, **_engine_options(database_url))
+
+if engine.dialect.name == 'sqlite':
+    @event.listens_for(engine, 'connect')
+    def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in Config.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+# Count and time every query for the request metrics, logging slow ones
+@event.listens_for(engine, 'before_cursor_execute')
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_times', []).append(time.perf_counter())
+
+@event.listens_for(engine, 'after_cursor_execute')
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info['query_start_times'].pop()
+    slow = seconds * 1000 >= Config.SLOW_QUERY_MS
+    if slow:
+        logger.warning(f"Slow query ({seconds * 1000:.1f} ms): {' '.join(statement.split())[:1000]}")
+    metrics.record_query(seconds, slow)
+
+@event.listens_for(engine, 'handle_error')
+def _discard_query_timer(context):
+    # A failed query never reaches after_cursor_execute
+    if context.connection is not None and context.connection.info.get('query_start_times'):
+        context.connection.info['query_start_times'].pop()
 
-engine = create_engine(Config.SQLALCHEMY_DATABASE_URI)
 db_session = scoped_session(sessionmaker(autocommit=False,
                                          autoflush=False,
                                          bind=engine))
@@ -14,7 +67,10 @@ Base.query = db_session.query_property()
 def init_db():
     """
     Initialize the database with the schema.
-    Import all modules that define models so they can be registered.
+    Import all modules that define models so they can be registered,
+    then apply any pending schema migrations to existing tables.
     """
     import models
+    from migrations import run_migrations
     Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
@@ -91,25 +91,16 @@ class ApiService {
   Future<Map<String, dynamic>?> checkInDevotee(String devoteeId) async {
     try {
       final response = await http.post(
-        Uri.parse('$baseUrl/devotee'),
-        headers: {'Content-Type': 'application/x-www-form-urlencoded'},
-        body: {
+        Uri.parse('$baseUrl/api/checkin'),
+        headers: {'Content-Type': 'application/json'},
+        body: json.encode({
           'devotee_id': devoteeId,
-        },
+        }),
       );
       
       if (response.statusCode == 200) {
-        // Parse HTML to extract JSON data (since Flask returns HTML)
-        final html = response.body;
-        final printDataMatch = RegExp(r'data-print-data="([^"]*)"').firstMatch(html);
-        
-        if (printDataMatch != null && printDataMatch.groupCount >= 1) {
-          final encodedData = printDataMatch.group(1)!;
-          // Decode HTML entities
-          final decodedData = htmlDecode(encodedData);
-          // Parse JSON data
-          return json.decode(decodedData);
-        }
+        // Label data plus the assigned item and label_id
+        return json.decode(response.body);
       }
       return null;
     } catch (e) {
@@ -118,6 +109,52 @@ class ApiService {
     }
   }
 
+  // Offline sync: devotee and item changes since a cursor, one page per call.
+  // Rows are lists of values in the order of 'fields'; pass the returned
+  // 'cursor' back until 'has_more' is false.
+  Future<Map<String, dynamic>?> getSyncChanges({String? cursor, int? limit}) async {
+    try {
+      final response = await http.get(
+        Uri.parse('$baseUrl/api/sync/changes').replace(queryParameters: {
+          if (cursor != null) 'cursor': cursor,
+          if (limit != null) 'limit': '$limit',
+        }),
+      );
+      
+      if (response.statusCode == 200) {
+        return json.decode(response.body);
+      }
+      return null;
+    } catch (e) {
+      print('Sync changes error: $e');
+      return null;
+    }
+  }
+
+  // Upload check-ins recorded while offline. Each needs a client-generated
+  // 'client_id' plus 'devotee_id', 'visited_at' (ISO 8601) and optionally
+  // 'item_id'; uploading the same check-ins again is safe.
+  Future<List<dynamic>?> uploadCheckins(List<Map<String, dynamic>> checkins) async {
+    try {
+      final response = await http.post(
+        Uri.parse('$baseUrl/api/sync/checkins'),
+        headers: {'Content-Type': 'application/json'},
+        body: json.encode({
+          'checkins': checkins,
+        }),
+      );
+      
+      if (response.statusCode == 200) {
+        // One result per check-in: ok, duplicate, not_found or invalid
+        return json.decode(response.body)['results'];
+      }
+      return null;
+    } catch (e) {
+      print('Upload check-ins error: $e');
+      return null;
+    }
+  }
+
   Future<bool> addDevotee(Devotee devotee) async {
     try {
       final response = await http.post(
@@ -191,52 +228,37 @@ class ApiService {
   }
 
   // Stats for dashboard
+  String? _dashboardEtag;
+  Map<String, dynamic> _dashboardStats = {};
+
   Future<Map<String, dynamic>> getDashboardStats() async {
     try {
-      final response = await http.get(Uri.parse('$baseUrl/dashboard'));
+      final response = await http.get(
+        Uri.parse('$baseUrl/api/dashboard'),
+        headers: {
+          if (_dashboardEtag != null) 'If-None-Match': _dashboardEtag!,
+        },
+      );
+      
+      // Nothing changed since the last fetch
+      if (response.statusCode == 304) {
+        return _dashboardStats;
+      }
       
       if (response.statusCode == 200) {
-        final html = response.body;
-        
-        // Extract statistics from HTML
-        final Map<String, dynamic> stats = {};
-        
-        // Extract total visits
-        final totalMatch = RegExp(r'<div class="stat-value">(\d+)</div>\s*<div class="stat-label">Total Visits</div>')
-            .firstMatch(html);
-        if (totalMatch != null) {
-          stats['totalVisits'] = int.parse(totalMatch.group(1)!);
-        }
-        
-        // Extract daily visits
-        final dailyMatch = RegExp(r'<div class="stat-value">(\d+)</div>\s*<div class="stat-label">Today\'s Visits</div>')
-            .firstMatch(html);
-        if (dailyMatch != null) {
-          stats['dailyVisits'] = int.parse(dailyMatch.group(1)!);
-        }
-        
-        // Extract monthly visits
-        final monthlyMatch = RegExp(r'<div class="stat-value">(\d+)</div>\s*<div class="stat-label">This Month</div>')
-            .firstMatch(html);
-        if (monthlyMatch != null) {
-          stats['monthlyVisits'] = int.parse(monthlyMatch.group(1)!);
-        }
-        
-        // Extract yearly visits
-        final yearlyMatch = RegExp(r'<div class="stat-value">(\d+)</div>\s*<div class="stat-label">This Year</div>')
-            .firstMatch(html);
-        if (yearlyMatch != null) {
-          stats['yearlyVisits'] = int.parse(yearlyMatch.group(1)!);
-        }
-        
-        // Extract total devotees
-        final devoteesMatch = RegExp(r'<div class="stat-value">(\d+)</div>\s*<div class="stat-label">Total Devotees</div>')
-            .firstMatch(html);
-        if (devoteesMatch != null) {
-          stats['totalDevotees'] = int.parse(devoteesMatch.group(1)!);
-        }
+        final data = json.decode(response.body);
+        final stats = data['stats'];
         
-        return stats;
+        _dashboardEtag = response.headers['etag'];
+        _dashboardStats = {
+          'totalVisits': stats['total_visits'],
+          'dailyVisits': stats['daily_visits'],
+          'monthlyVisits': stats['monthly_visits'],
+          'yearlyVisits': stats['yearly_visits'],
+          'totalDevotees': stats['total_devotees'],
+          'reports': data['reports'],
+        };
+        return _dashboardStats;
       }
       return {};
     } catch (e) {
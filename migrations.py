@@ -0,0 +1,105 @@
+"""
+Schema migrations
+
+Base.metadata.create_all() only creates missing tables, it never changes a
+table that already exists. Every change to an existing table is therefore a
+numbered migration here. Migrations run in order from init_db(), each one
+exactly once, and are recorded in the schema_migrations table. They must be
+safe to run against a database that create_all() has just created with the
+current schema.
+"""
+
+import logging
+from sqlalchemy import inspect, insert, select
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+from models import SchemaMigration, SyncState, Devotee, Item, Visit
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS = []
+
+def migration(version, name):
+    """
+    Register a migration function taking a Connection.
+    """
+    def register(func):
+        MIGRATIONS.append((version, name, func))
+        return func
+    return register
+
+def run_migrations(engine):
+    """
+    Apply all pending migrations, each in its own transaction.
+    
+    Args:
+        engine (Engine): The engine to migrate
+    
+    Returns:
+        list: The versions that were applied
+    """
+    migration_table = SchemaMigration.__table__
+    
+    with engine.connect() as connection:
+        applied = set(connection.execute(select(migration_table.c.version)).scalars())
+    
+    newly_applied = []
+    for version, name, func in sorted(MIGRATIONS, key=lambda entry: entry[0]):
+        if version in applied:
+            continue
+        
+        logger.info(f"Applying migration {version}: {name}")
+        with engine.begin() as connection:
+            func(connection)
+            connection.execute(insert(migration_table).values(version=version, name=name))
+        newly_applied.append(version)
+    
+    return newly_applied
+
+def _create_missing_indexes(connection, table):
+    # Indexes on columns a later migration adds are created by that migration
+    existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    for index in table.indexes:
+        if all(column.name in existing for column in index.columns):
+            connection.execute(CreateIndex(index, if_not_exists=True))
+
+def _add_missing_columns(connection, table, *names):
+    existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    for name in names:
+        if name not in existing:
+            column_ddl = CreateColumn(table.c[name]).compile(dialect=connection.dialect)
+            connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column_ddl}')
+
+@migration(1, 'visit indexes')
+def add_visit_indexes(connection):
+    # visit_date for date ranges, (devotee_id, visit_date) for visit history
+    # and item_id for per-item lookups
+    _create_missing_indexes(connection, Visit.__table__)
+
+@migration(2, 'devotee search indexes')
+def add_devotee_search_indexes(connection):
+    # lower(devotee_id), lower(name) and phone for the devotee list search
+    _create_missing_indexes(connection, Devotee.__table__)
+
+@migration(3, 'delta sync columns')
+def add_sync_columns(connection):
+    # sync_version on devotees and items, existing rows start at 0 so that a
+    # first sync returns all of them; client_ref for idempotent offline uploads
+    _add_missing_columns(connection, Devotee.__table__, 'sync_version')
+    _add_missing_columns(connection, Item.__table__, 'sync_version')
+    _add_missing_columns(connection, Visit.__table__, 'client_ref')
+    _create_missing_indexes(connection, Devotee.__table__)
+    _create_missing_indexes(connection, Visit.__table__)
+    
+    sync_state = SyncState.__table__
+    if connection.execute(select(sync_state.c.id)).first() is None:
+        connection.execute(insert(sync_state).values(id=1, version=0))
+
+@migration(4, 'devotee visit counters')
+def add_visit_counters(connection):
+    # visit_count and last_visit_at, backfilled from visits and the archive
+    # summary, with indexes for top devotees and recently active devotees
+    from utils.visit_counters import reconcile_statement
+    _add_missing_columns(connection, Devotee.__table__, 'visit_count', 'last_visit_at')
+    _create_missing_indexes(connection, Devotee.__table__)
+    connection.execute(reconcile_statement())
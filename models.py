@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Date
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Date, Index, Text, func
 from sqlalchemy.orm import relationship
 from flask_login import UserMixin
 from datetime import datetime
@@ -28,9 +28,25 @@ class Devotee(Base):
     email = Column(String(120))
     address = Column(String(200))
     created_at = Column(DateTime, default=datetime.now)
+    # Change counter value of the last change, for delta sync
+    sync_version = Column(Integer, default=0, server_default='0', nullable=False)
+    # Maintained with every visit insert, archived visits included
+    visit_count = Column(Integer, default=0, server_default='0', nullable=False)
+    last_visit_at = Column(DateTime)
     
     visits = relationship('Visit', backref='devotee', lazy=True)
     
+    # Case-insensitive prefix search on the devotee list, changes in sync
+    # order, top devotees and recently active devotees
+    __table_args__ = (
+        Index('ix_devotees_devotee_id_lower', func.lower(devotee_id)),
+        Index('ix_devotees_name_lower', func.lower(name)),
+        Index('ix_devotees_phone', phone),
+        Index('ix_devotees_sync_version', sync_version, id),
+        Index('ix_devotees_visit_count', visit_count),
+        Index('ix_devotees_last_visit_at', last_visit_at),
+    )
+    
     def __repr__(self):
         return f'<Devotee {self.devotee_id}: {self.name}>'
 
@@ -40,6 +56,7 @@ class Item(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String(100), nullable=False)
     description = Column(String(200))
+    sync_version = Column(Integer, default=0, server_default='0', nullable=False)
     
     visits = relationship('Visit', backref='item', lazy=True)
     
@@ -51,8 +68,104 @@ class Visit(Base):
     
     id = Column(Integer, primary_key=True)
     devotee_id = Column(Integer, ForeignKey('devotees.id'), nullable=False)
-    item_id = Column(Integer, ForeignKey('items.id'), nullable=False)
-    visit_date = Column(DateTime, default=datetime.now, nullable=False)
+    item_id = Column(Integer, ForeignKey('items.id'), nullable=False, index=True)
+    visit_date = Column(DateTime, default=datetime.now, nullable=False, index=True)
+    # Client-generated ID of an offline check-in, makes uploads idempotent
+    client_ref = Column(String(64))
+    
+    __table_args__ = (
+        Index('ix_visits_devotee_id_visit_date', 'devotee_id', 'visit_date'),
+        Index('ix_visits_client_ref', 'client_ref', unique=True),
+    )
     
     def __repr__(self):
         return f'<Visit {self.devotee_id} on {self.visit_date}>'
+
+class VisitDailyRollup(Base):
+    __tablename__ = 'visit_daily_rollup'
+    
+    day = Column(Date, primary_key=True)
+    item_id = Column(Integer, ForeignKey('items.id'), primary_key=True)
+    visit_count = Column(Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<VisitDailyRollup {self.day} item {self.item_id}: {self.visit_count}>'
+
+class VisitArchive(Base):
+    __tablename__ = 'visit_archives'
+    
+    year = Column(Integer, primary_key=True)
+    filename = Column(String(200), nullable=False)
+    visit_count = Column(Integer, default=0, nullable=False)
+    first_visit = Column(DateTime)
+    last_visit = Column(DateTime)
+    # Visits before this date are in the archive files rather than in visits
+    archived_before = Column(Date, nullable=False)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, nullable=False)
+    
+    def __repr__(self):
+        return f'<VisitArchive {self.year}: {self.visit_count} visits>'
+
+class ArchivedVisitSummary(Base):
+    __tablename__ = 'archived_visit_summary'
+    
+    devotee_id = Column(Integer, ForeignKey('devotees.id'), primary_key=True)
+    visit_count = Column(Integer, default=0, nullable=False)
+    first_visit = Column(DateTime)
+    last_visit = Column(DateTime)
+    
+    def __repr__(self):
+        return f'<ArchivedVisitSummary {self.devotee_id}: {self.visit_count}>'
+
+class SyncState(Base):
+    __tablename__ = 'sync_state'
+    
+    # Named counters: row 1 is the change counter for delta sync, row 2 the
+    # report data generation
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<SyncState {self.version}>'
+
+class SchemaMigration(Base):
+    __tablename__ = 'schema_migrations'
+    
+    version = Column(Integer, primary_key=True)
+    name = Column(String(100), nullable=False)
+    applied_at = Column(DateTime, default=datetime.now, nullable=False)
+    
+    def __repr__(self):
+        return f'<SchemaMigration {self.version}: {self.name}>'
+
+class PrintJob(Base):
+    __tablename__ = 'print_jobs'
+    
+    id = Column(Integer, primary_key=True)
+    printer = Column(String(50), nullable=False)
+    payload = Column(Text, nullable=False)
+    status = Column(String(20), default='queued', nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    error = Column(String(200))
+    claimed_by = Column(String(32))
+    created_at = Column(DateTime, default=datetime.now, nullable=False)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, nullable=False)
+    printed_at = Column(DateTime)
+    
+    __table_args__ = (
+        Index('ix_print_jobs_status_printer', 'status', 'printer'),
+    )
+    
+    def __repr__(self):
+        return f'<PrintJob {self.id} on {self.printer}: {self.status}>'
+
+class LabelTicket(Base):
+    __tablename__ = 'label_tickets'
+    
+    id = Column(String(32), primary_key=True)
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.now, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<LabelTicket {self.id}>'
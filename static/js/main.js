@@ -95,43 +95,28 @@ function initPrintButton() {
 
 // Initialize dashboard charts
 function initDashboardCharts() {
-    fetchReportData('daily')
+    fetchDashboardData()
         .then(data => {
-            createDailyVisitsChart(data);
+            createDailyVisitsChart(data.reports.daily);
+            createMonthlyVisitsChart(data.reports.monthly);
+            createYearlyVisitsChart(data.reports.yearly);
+            createDevoteesChart(data.reports.devotees);
         })
         .catch(error => {
-            console.error('Error fetching daily report data:', error);
-            showNotification('Failed to load daily report data', 'error');
-        });
-        
-    fetchReportData('monthly')
-        .then(data => {
-            createMonthlyVisitsChart(data);
-        })
-        .catch(error => {
-            console.error('Error fetching monthly report data:', error);
-            showNotification('Failed to load monthly report data', 'error');
-        });
-        
-    fetchReportData('yearly')
-        .then(data => {
-            createYearlyVisitsChart(data);
-        })
-        .catch(error => {
-            console.error('Error fetching yearly report data:', error);
-            showNotification('Failed to load yearly report data', 'error');
-        });
-        
-    fetchReportData('devotees')
-        .then(data => {
-            createDevoteesChart(data);
-        })
-        .catch(error => {
-            console.error('Error fetching devotees report data:', error);
-            showNotification('Failed to load devotees report data', 'error');
+            console.error('Error fetching dashboard data:', error);
+            showNotification('Failed to load dashboard report data', 'error');
         });
 }
 
+// Fetch all dashboard stats and chart series in one request
+async function fetchDashboardData() {
+    const response = await fetch('/api/dashboard');
+    if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    return await response.json();
+}
+
 // Fetch report data from the server
 async function fetchReportData(reportType) {
     const response = await fetch(`/api/reports/${reportType}`);
@@ -237,7 +222,12 @@ function initDevoteeCalendar() {
     const devoteeId = document.querySelector('#devotee-calendar').dataset.devoteeId;
     if (!devoteeId) return;
     
-    fetch(`/api/devotee/${devoteeId}/visits`)
+    // The calendar covers the current month and the 11 before it
+    const today = new Date();
+    const first = new Date(today.getFullYear(), today.getMonth() - 11, 1);
+    const start = `${first.getFullYear()}-${String(first.getMonth() + 1).padStart(2, '0')}-01`;
+    
+    fetch(`/api/devotee/${devoteeId}/visits?start=${start}`)
         .then(response => {
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
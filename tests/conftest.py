@@ -0,0 +1,39 @@
+"""
+Shared fixtures: an app on a throwaway SQLite database with a logged-in admin.
+"""
+
+import os
+import tempfile
+
+import pytest
+
+# The engine is created on import, so the database (and the archive
+# directory) must be chosen first
+_database_dir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_database_dir, 'test.db')}"
+os.environ['ARCHIVE_DIR'] = os.path.join(_database_dir, 'archive')
+
+from werkzeug.security import generate_password_hash
+
+import app as app_module
+from database import db_session
+from models import User
+from utils.report_cache import report_cache
+
+@pytest.fixture(scope='session')
+def app():
+    app = app_module.create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with app.app_context():
+        app_module.initialize_database()
+        db_session.add(User(username='admin', email='admin@example.com', password=generate_password_hash('secret'), is_admin=True))
+        db_session.commit()
+        db_session.remove()
+    return app
+
+@pytest.fixture
+def client(app):
+    report_cache.clear()
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'secret'})
+    return client
@@ -0,0 +1,149 @@
+"""
+Archiving must not change what reports, visit history and exports return.
+"""
+
+import random
+from datetime import datetime, time, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from database import db_session, engine
+from models import Devotee, Visit
+from utils.analytics import visit_snapshot
+from utils.archive import archive_cutoff, archive_visits
+from utils.report_cache import report_cache
+
+DEVOTEE_IDS = [f'A{number:03d}' for number in range(12)]
+DAYS = 4 * 365
+
+def _start():
+    return datetime.now().date() - timedelta(days=DAYS)
+
+def _cutoff():
+    return datetime.now().date() - timedelta(days=2 * 365)
+
+def _report_urls():
+    start = _start().isoformat()
+    cutoff = _cutoff()
+    return [
+        '/api/reports/daily',
+        '/api/reports/monthly',
+        '/api/reports/yearly',
+        '/api/reports/devotees',
+        '/api/reports/items',
+        f'/api/reports/timeseries?granularity=month&start={start}',
+        f'/api/reports/timeseries?start={cutoff - timedelta(days=10)}&end={cutoff + timedelta(days=10)}',
+        f'/api/reports/heatmap?start={start}',
+        '/api/reports/retention?months=60',
+        f'/api/reports/item_distribution?granularity=year&start={start}'
+    ]
+
+def _history(client, devotee_id):
+    # Every page of the visit history, following next_after
+    pages = []
+    after = None
+    while True:
+        url = f'/api/devotee/{devotee_id}/visits?limit=25'
+        if after is not None:
+            url += f'&after={after}'
+        page = client.get(url).get_json()
+        pages.append(page)
+        after = page['next_after']
+        if after is None:
+            return pages
+
+def _results(client):
+    # Computed afresh, not served from the caches
+    report_cache.clear()
+    visit_snapshot.invalidate()
+    cutoff = _cutoff()
+    return {
+        'reports': {url: client.get(url).get_json() for url in _report_urls()},
+        'dashboard': client.get('/api/dashboard').get_json(),
+        'history': {devotee_id: _history(client, devotee_id) for devotee_id in DEVOTEE_IDS[:3]},
+        'history_around_cutoff': client.get(
+            f'/api/devotee/{DEVOTEE_IDS[0]}/visits?start={cutoff - timedelta(days=60)}&end={cutoff + timedelta(days=60)}'
+        ).get_json(),
+        'export': client.get('/api/visits/export?format=csv').get_data(as_text=True),
+        'export_around_cutoff': client.get(
+            f'/api/visits/export?format=jsonl&start={cutoff - timedelta(days=60)}&end={cutoff + timedelta(days=60)}'
+        ).get_data(as_text=True)
+    }
+
+@pytest.fixture(scope='module')
+def seeded(app):
+    # Two visits a day over four years, added in date order like check-ins
+    generator = random.Random(22)
+    with app.app_context():
+        devotees = [Devotee(devotee_id=devotee_id, name=f'Archive Devotee {devotee_id}') for devotee_id in DEVOTEE_IDS]
+        db_session.add_all(devotees)
+        db_session.flush()
+        start = _start()
+        for day in range(DAYS + 1):
+            for hour in sorted(generator.sample(range(6, 21), 2)):
+                db_session.add(Visit(
+                    devotee_id=generator.choice(devotees).id,
+                    item_id=generator.randint(1, 18),
+                    visit_date=datetime.combine(start + timedelta(days=day), time(hour, generator.randint(0, 59)))
+                ))
+        db_session.commit()
+        db_session.remove()
+    
+    runner = app.test_cli_runner()
+    for command in ('rebuild-rollup', 'reconcile-visit-counters'):
+        result = runner.invoke(args=[command])
+        assert result.exit_code == 0, result.output
+    
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'secret'})
+    return client, _results(client)
+
+def test_interrupted_archive_does_not_double_count(app, seeded):
+    client, before = seeded
+    
+    # Fail on the third month: its visits are copied into the archive file
+    # but the delete from the visits table is rolled back
+    deletes = []
+    def interrupt(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('DELETE FROM visits'):
+            deletes.append(statement)
+            if len(deletes) == 3:
+                raise RuntimeError('interrupted')
+    
+    event.listen(engine, 'before_cursor_execute', interrupt)
+    try:
+        with app.app_context():
+            with pytest.raises(RuntimeError, match='interrupted'):
+                archive_visits(_cutoff())
+            db_session.remove()
+    finally:
+        event.remove(engine, 'before_cursor_execute', interrupt)
+    
+    with app.app_context():
+        assert archive_cutoff() is not None
+        assert archive_cutoff() < _cutoff()
+        db_session.remove()
+    assert _results(client) == before
+    
+    # Repeating the run finishes it without archiving anything twice
+    result = app.test_cli_runner().invoke(args=['archive-visits', '--before', _cutoff().isoformat()])
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        assert archive_cutoff() == _cutoff()
+        db_session.remove()
+    assert _results(client) == before
+
+def test_archive_keeps_results(app, seeded):
+    client, before = seeded
+    
+    # Move the cutoff forward once more, past a few more months
+    result = app.test_cli_runner().invoke(args=['archive-visits', '--before', (_cutoff() + timedelta(days=90)).isoformat()])
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        assert db_session.query(Visit).filter(Visit.visit_date < datetime.combine(_cutoff(), time.min)).count() == 0
+        db_session.remove()
+    
+    after = _results(client)
+    assert after == before
+    assert sum(len(page['visits']) for page in after['history'][DEVOTEE_IDS[0]]) > 25
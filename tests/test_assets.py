@@ -0,0 +1,67 @@
+"""
+The static bundles: minified scripts must stay valid JavaScript.
+"""
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from utils.assets import BUNDLES, build_assets, minify_js
+
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+
+node = shutil.which('node')
+requires_node = pytest.mark.skipif(node is None, reason='node is needed to check JavaScript syntax')
+
+def node_check(path):
+    result = subprocess.run([node, '--check', str(path)], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+@requires_node
+@pytest.mark.parametrize('source', BUNDLES['app.js'])
+def test_minified_scripts_are_valid(tmp_path, source):
+    with open(os.path.join(STATIC_FOLDER, source), encoding='utf-8') as f:
+        minified = minify_js(f.read())
+    path = tmp_path / 'minified.js'
+    path.write_text(minified, encoding='utf-8')
+    node_check(path)
+
+@requires_node
+def test_bundle_is_valid(tmp_path):
+    static_folder = tmp_path / 'static'
+    shutil.copytree(STATIC_FOLDER, static_folder, ignore=shutil.ignore_patterns('dist'))
+    manifest = build_assets(str(static_folder))
+    node_check(static_folder / 'dist' / manifest['files']['app.js'])
+
+def test_minify_js_keeps_literals_and_operators():
+    source = (
+        "const re = /a\\/b[/]c/g; // comment\n"
+        "let half = total / 2 / count;\n"
+        "function f() {\n"
+        "    return /x+/.test(s);\n"
+        "}\n"
+        "const s = 'a  //  b' + `c ${d}  /* e */`;\n"
+        "x = a + +b - -c;\n"
+        "y = i++\n"
+        "z = 1\n"
+    )
+    minified = minify_js(source)
+    assert "/a\\/b[/]c/g" in minified
+    assert "total/2/count" in minified
+    assert "return/x+/.test(s)" in minified
+    assert "'a  //  b'" in minified and "`c ${d}  /* e */`" in minified
+    assert "a+ +b- -c" in minified
+    # Line breaks that may end a statement are kept
+    assert "i++\nz=1" in minified
+
+def test_compressed_asset_is_named_after_the_bundle(client):
+    page = client.get('/dashboard').get_data(as_text=True)
+    url = page.split('src="/assets/', 1)[1].split('"', 1)[0]
+    response = client.get(f'/assets/{url}', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Cache-Control'].endswith('immutable')
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert response.headers['Content-Disposition'].endswith(f'filename={url}')
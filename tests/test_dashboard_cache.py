@@ -0,0 +1,20 @@
+"""
+The cached dashboard must follow its ETag.
+"""
+
+def test_dashboard_after_add_devotee(client):
+    first = client.get('/api/dashboard')
+    assert first.status_code == 200
+    devotees = first.get_json()['stats']['total_devotees']
+    
+    client.post('/add_devotee', data={'devotee_id': 'T001', 'name': 'Test Devotee', 'phone': '9800000001'})
+    
+    # The old ETag is stale, and the new body counts the devotee
+    second = client.get('/api/dashboard', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.headers['ETag'] != first.headers['ETag']
+    assert second.get_json()['stats']['total_devotees'] == devotees + 1
+    
+    # Revalidating with the new ETag is answered without a body
+    third = client.get('/api/dashboard', headers={'If-None-Match': second.headers['ETag']})
+    assert third.status_code == 304
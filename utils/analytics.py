@@ -0,0 +1,274 @@
+"""
+Vectorized analytics over a columnar snapshot of the visits table
+
+The snapshot holds one NumPy array per column (visit id, devotee pk, item
+pk and the visit time in seconds since the epoch) for all visits, archived
+ones included, and is refreshed incrementally by loading only visits with a
+higher id than it already has.
+Reports are computed over the arrays without further queries, so they stay
+fast over millions of visits.
+
+NumPy is an optional dependency (pip install .[analytics]); without it the
+analytics report types raise ValueError.
+"""
+
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import BigInteger, Integer, cast, func, select
+
+from database import db_session, engine
+from models import Visit
+from utils.archive import archived_visit_tables
+from utils.item_catalog import item_catalog
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+# Visits fetched per round trip while loading the snapshot
+LOAD_BATCH_SIZE = 100000
+
+_EPOCH = datetime(1970, 1, 1)
+_SECONDS_PER_DAY = 86400
+
+def _epoch_seconds(column):
+    # Convert in the database where possible, it is much faster than Python
+    if engine.dialect.name == 'sqlite':
+        return cast(func.strftime('%s', column), Integer)
+    elif engine.dialect.name == 'postgresql':
+        return cast(func.extract('epoch', column), BigInteger)
+    return None
+
+def _to_epoch(day):
+    return int((datetime.combine(day, datetime.min.time()) - _EPOCH).total_seconds())
+
+def require_numpy():
+    """
+    Raise ValueError if NumPy is not installed.
+    """
+    if np is None:
+        raise ValueError('Analytics reports require NumPy, install it with: pip install .[analytics]')
+
+class VisitSnapshot:
+    """
+    Visits held as parallel NumPy arrays, refreshed by max visit id.
+    
+    Visit times are naive local datetimes stored as seconds since
+    1970-01-01 of that local time, so hours and weekdays come out as they
+    were recorded.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._columns = None
+        self._id_range = None
+    
+    def columns(self):
+        """
+        Get the current snapshot, refreshing it first.
+        
+        Returns:
+            dict: Arrays keyed by id, devotee, item and ts, all of equal length
+        """
+        require_numpy()
+        self.refresh()
+        return self._columns
+    
+    def refresh(self):
+        """
+        Load the visits added since the last refresh.
+        
+        Visits are only appended, or removed from the oldest end when
+        archived, so comparing the lowest and highest visit id (two index
+        lookups) tells whether anything changed; the snapshot is reloaded
+        in full, archived visits included, when old visits went away.
+        """
+        with self._lock:
+            # Separate subqueries, SQLite only uses the index for a lone min() or max()
+            min_id, max_id = db_session.query(
+                select(func.min(Visit.id)).scalar_subquery(),
+                select(func.max(Visit.id)).scalar_subquery()
+            ).one()
+            columns = self._columns
+            
+            if columns is not None:
+                known_min, known_max = self._id_range
+                if (min_id, max_id) == (known_min, known_max):
+                    return
+                if known_max is not None and min_id == known_min and max_id > known_max:
+                    added = self._load(Visit.__table__, Visit.id > known_max)
+                    self._columns = {name: np.concatenate([columns[name], added[name]]) for name in added}
+                    self._id_range = (min_id, max_id)
+                    return
+            
+            chunks = [self._load(table, archived) for table, archived in archived_visit_tables()]
+            chunks.append(self._load(Visit.__table__))
+            self._columns = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[-1]}
+            self._id_range = (min_id, max_id)
+    
+    def invalidate(self):
+        """
+        Drop the snapshot so that it is reloaded in full on next use.
+        """
+        with self._lock:
+            self._columns = None
+    
+    def _load(self, table, *conditions):
+        epoch = _epoch_seconds(table.c.visit_date)
+        query = select(
+            table.c.id, table.c.devotee_id, table.c.item_id,
+            epoch if epoch is not None else table.c.visit_date
+        ).where(*conditions).order_by(table.c.id)
+        
+        # Core rows converted to plain tuples, NumPy is slow on Row objects
+        chunks = []
+        result = db_session.connection().execution_options(yield_per=LOAD_BATCH_SIZE).execute(query)
+        for rows in result.partitions():
+            if epoch is None:
+                rows = [
+                    (visit_id, devotee_id, item_id, int((visit_date - _EPOCH).total_seconds()))
+                    for visit_id, devotee_id, item_id, visit_date in rows
+                ]
+            chunks.append(np.array([tuple(row) for row in rows], dtype=np.int64).reshape(-1, 4))
+        
+        data = np.concatenate(chunks) if chunks else np.empty((0, 4), dtype=np.int64)
+        return {
+            'id': data[:, 0].copy(),
+            'devotee': data[:, 1].astype(np.int32),
+            'item': data[:, 2].astype(np.int32),
+            'ts': data[:, 3].copy()
+        }
+
+visit_snapshot = VisitSnapshot()
+
+def _select_range(columns, start_date, end_date):
+    # Boolean mask of the visits between two dates (inclusive)
+    ts = columns['ts']
+    return (ts >= _to_epoch(start_date)) & (ts < _to_epoch(end_date + timedelta(days=1)))
+
+def generate_heatmap_report(start_date, end_date):
+    """
+    Count visits by weekday and hour of day.
+    
+    Args:
+        start_date (date): First day of the range
+        end_date (date): Last day of the range
+    
+    Returns:
+        dict: weekdays (row labels), hours (column labels) and values, a
+            7 x 24 matrix of visit counts
+    """
+    columns = visit_snapshot.columns()
+    ts = columns['ts'][_select_range(columns, start_date, end_date)]
+    
+    days = ts // _SECONDS_PER_DAY
+    # 1970-01-01 was a Thursday
+    weekdays = (days + 3) % 7
+    hours = (ts % _SECONDS_PER_DAY) // 3600
+    counts = np.bincount(weekdays * 24 + hours, minlength=7 * 24).reshape(7, 24)
+    
+    return {
+        'weekdays': WEEKDAYS,
+        'hours': list(range(24)),
+        'values': counts.tolist()
+    }
+
+def generate_retention_report(months=12):
+    """
+    Build monthly retention cohorts.
+    
+    Devotees are grouped by the month of their first visit; for each cohort
+    the report gives how many of them visited again 0, 1, 2, ... months later.
+    
+    Args:
+        months (int): Number of most recent cohorts, and of months tracked
+    
+    Returns:
+        dict: cohorts (month labels), sizes (devotees per cohort), offsets
+            (months since the first visit), counts (returning devotees per
+            cohort and offset) and rates (counts divided by sizes)
+    """
+    columns = visit_snapshot.columns()
+    if not len(columns['ts']):
+        return {'cohorts': [], 'sizes': [], 'offsets': list(range(months)), 'counts': [], 'rates': []}
+    
+    devotee = columns['devotee'].astype(np.int64)
+    month = columns['ts'].astype('datetime64[s]').astype('datetime64[M]').astype(np.int64)
+    
+    # Distinct (devotee, month) pairs, sorted by devotee and then by month
+    pairs = np.sort(devotee * 100000 + month)
+    pairs = pairs[np.r_[True, pairs[1:] != pairs[:-1]]]
+    pair_devotee = pairs // 100000
+    pair_month = pairs % 100000
+    
+    # The first pair of every devotee holds the month of their first visit
+    first = np.flatnonzero(np.r_[True, pair_devotee[1:] != pair_devotee[:-1]])
+    pair_cohort = np.repeat(pair_month[first], np.diff(np.r_[first, len(pairs)]))
+    pair_offset = pair_month - pair_cohort
+    
+    last_cohort = int(month.max())
+    first_cohort = last_cohort - months + 1
+    keep = (pair_cohort >= first_cohort) & (pair_offset < months)
+    counts = np.bincount(
+        (pair_cohort[keep] - first_cohort) * months + pair_offset[keep],
+        minlength=months * months
+    ).reshape(months, months)
+    
+    sizes = counts[:, 0]
+    rates = np.divide(counts, sizes[:, None], out=np.zeros(counts.shape), where=sizes[:, None] > 0)
+    labels = [
+        np.datetime64(first_cohort + index, 'M').astype(datetime).strftime('%b %Y')
+        for index in range(months)
+    ]
+    
+    return {
+        'cohorts': labels,
+        'sizes': sizes.tolist(),
+        'offsets': list(range(months)),
+        'counts': counts.tolist(),
+        'rates': np.round(rates, 4).tolist()
+    }
+
+def generate_item_distribution_report(buckets, range_end, label_format):
+    """
+    Count visits per item and period.
+    
+    Args:
+        buckets (list): First day of every period, in order
+        range_end (date): Last day of the last period
+        label_format (str): strftime format for the period labels
+    
+    Returns:
+        dict: labels (periods), items (item names) and values, one list of
+            per-period counts for each item
+    """
+    columns = visit_snapshot.columns()
+    mask = _select_range(columns, buckets[0], range_end)
+    ts = columns['ts'][mask]
+    item_ids = columns['item'][mask]
+    
+    # Map item ids to rows of the result, unknown ids to an extra row
+    items = item_catalog.items()
+    max_item_id = max([item_id for item_id, _ in items] + [int(item_ids.max()) if len(item_ids) else 0])
+    positions = np.full(max_item_id + 1, len(items), dtype=np.int64)
+    for index, (item_id, _) in enumerate(items):
+        positions[item_id] = index
+    
+    bucket_edges = np.array([_to_epoch(bucket) for bucket in buckets], dtype=np.int64)
+    period = np.searchsorted(bucket_edges, ts, side='right') - 1
+    item_index = positions[item_ids]
+    # Visits of items missing from the catalog are left out
+    known = item_index < len(items)
+    counts = np.bincount(
+        item_index[known] * len(buckets) + period[known],
+        minlength=len(items) * len(buckets)
+    ).reshape(len(items), len(buckets))
+    
+    return {
+        'labels': [bucket.strftime(label_format) for bucket in buckets],
+        'items': [name for _, name in items],
+        'values': counts.tolist()
+    }
@@ -0,0 +1,275 @@
+"""
+Cold storage of old visits in per-year SQLite archive files
+
+Visits older than the archive horizon are moved out of the visits table
+into one SQLite file per year (visits_2019.db, ...) in ARCHIVE_DIR. What
+the hot paths need from them is kept in the main database: the daily
+rollup keeps its rows for archived days, archived_visit_summary holds the
+archived visit count of every devotee and visit_archives lists the archive
+files together with the date before which all visits were archived.
+
+Archive files are ATTACHed to a connection only when a query needs visits
+from before that date, i.e. the visit history, the visit export and the
+analytics snapshot. Archiving requires SQLite.
+"""
+
+import os
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, Table, and_, func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config import Config
+from database import db_session, engine
+from models import ArchivedVisitSummary, Visit, VisitArchive
+
+# Archives attached to one connection at a time, SQLite allows 10 databases
+MAX_ATTACHED_ARCHIVES = 8
+
+_archive_tables = {}
+
+def archive_filename(year):
+    """
+    Get the file name of the archive of a year, relative to ARCHIVE_DIR.
+    """
+    return f'visits_{year}.db'
+
+def archive_table(year):
+    """
+    Get the visits table of the archive of a year.
+    
+    The archive is attached as archive_<year>, so the table is only usable on
+    a connection passed to attach_archive() first.
+    
+    Args:
+        year (int): The archived year
+    
+    Returns:
+        Table: The archived visits table
+    """
+    table = _archive_tables.get(year)
+    if table is None:
+        table = Table(
+            'visits', MetaData(),
+            Column('id', Integer, primary_key=True),
+            Column('devotee_id', Integer, nullable=False),
+            Column('item_id', Integer, nullable=False),
+            Column('visit_date', DateTime, nullable=False, index=True),
+            Index('ix_visits_devotee_id_visit_date', 'devotee_id', 'visit_date'),
+            schema=f'archive_{year}'
+        )
+        _archive_tables[year] = table
+    return table
+
+def attach_archive(connection, year, create=False):
+    """
+    Attach the archive of a year to a connection unless it already is.
+    
+    The least recently used archives are detached again to stay within
+    SQLite's limit on attached databases.
+    
+    Args:
+        connection (Connection): The connection to attach to
+        year (int): The archived year
+        create (bool): Create the archive file and its table if missing
+    
+    Returns:
+        Table: The archived visits table
+    """
+    attached = connection.info.setdefault('attached_archives', OrderedDict())
+    table = archive_table(year)
+    
+    if year in attached:
+        attached.move_to_end(year)
+    else:
+        while len(attached) >= MAX_ATTACHED_ARCHIVES:
+            oldest, _ = attached.popitem(last=False)
+            connection.exec_driver_sql(f'DETACH DATABASE archive_{oldest}')
+        path = os.path.join(Config.ARCHIVE_DIR, archive_filename(year))
+        if not create and not os.path.exists(path):
+            raise RuntimeError(f'Archive file {path} is missing')
+        connection.exec_driver_sql(f'ATTACH DATABASE ? AS archive_{year}', (path,))
+        attached[year] = True
+    
+    if create:
+        table.create(connection, checkfirst=True)
+    return table
+
+def archive_cutoff():
+    """
+    Get the date before which visits have been archived.
+    
+    Returns:
+        date: The cutoff, or None if nothing has been archived
+    """
+    cutoff = db_session.query(func.max(VisitArchive.archived_before)).scalar()
+    if isinstance(cutoff, str):
+        cutoff = date.fromisoformat(cutoff)
+    return cutoff
+
+def archived_visit_tables(start=None, end=None):
+    """
+    Attach the archives with visits between two dates, oldest first.
+    
+    Nothing is attached, and nothing yielded, when the range starts on or
+    after the archive cutoff. Archives are attached to the session's
+    connection one at a time, as the caller moves on to the next one.
+    
+    Args:
+        start (date): First day of the range, defaults to the first archived day
+        end (date): Last day of the range, defaults to the cutoff
+    
+    Yields:
+        tuple: The archived visits table and the condition selecting its
+            archived visits, to be combined with the caller's filters
+    """
+    cutoff = archive_cutoff()
+    if cutoff is None or (start is not None and start >= cutoff):
+        return
+    
+    query = db_session.query(VisitArchive.year).order_by(VisitArchive.year)
+    if start is not None:
+        query = query.filter(VisitArchive.year >= start.year)
+    if end is not None:
+        query = query.filter(VisitArchive.year <= end.year)
+    years = [year for year, in query]
+    
+    for year in years:
+        table = attach_archive(db_session.connection(), year)
+        # Visits copied by an interrupted run are still in visits as well
+        yield table, table.c.visit_date < datetime.combine(cutoff, time.min)
+
+def _month_ranges(start, end):
+    # [first, next) datetimes of every month overlapping [start, end)
+    current = datetime(start.year, start.month, 1)
+    while current < end:
+        following = datetime(current.year + current.month // 12, current.month % 12 + 1, 1)
+        yield max(current, start), min(following, end)
+        current = following
+
+def archive_visits(before=None, progress=None):
+    """
+    Move the visits before a date into the per-year archive files.
+    
+    Visits are moved a month at a time. Each month is first copied into its
+    archive file and committed there, then summarized and deleted from the
+    visits table in one transaction on the main database, so check-ins are
+    only blocked briefly and an interrupted run can simply be repeated.
+    
+    Args:
+        before (date): Archive visits before this date, defaults to
+            ARCHIVE_AFTER_DAYS ago. The cutoff never moves back.
+        progress (callable): Called with (year, month start, visits moved)
+            after every month
+    
+    Returns:
+        dict: The cutoff (before) and the visits moved per year (years)
+    
+    Raises:
+        RuntimeError: If the database is not SQLite
+    """
+    if engine.dialect.name != 'sqlite':
+        raise RuntimeError('Archiving visits is only available for SQLite')
+    
+    if before is None:
+        before = datetime.now().date() - timedelta(days=Config.ARCHIVE_AFTER_DAYS)
+    cutoff = archive_cutoff()
+    if cutoff is not None and before < cutoff:
+        before = cutoff
+    
+    first_visit, max_id = db_session.query(
+        select(func.min(Visit.visit_date)).scalar_subquery(),
+        select(func.max(Visit.id)).scalar_subquery()
+    ).one()
+    db_session.commit()
+    
+    moved = {}
+    end = datetime.combine(before, time.min)
+    if first_visit is None or first_visit >= end:
+        return {'before': before, 'years': moved}
+    
+    os.makedirs(Config.ARCHIVE_DIR, exist_ok=True)
+    with engine.connect() as connection:
+        for range_start, range_end in _month_ranges(first_visit, end):
+            count = _archive_range(connection, range_start, range_end, max_id, before)
+            moved[range_start.year] = moved.get(range_start.year, 0) + count
+            if progress is not None:
+                progress(range_start.year, range_start.date(), count)
+    
+    return {'before': before, 'years': moved}
+
+def _archive_range(connection, range_start, range_end, max_id, before):
+    year = range_start.year
+    visits = Visit.__table__
+    
+    # The newest visit always stays, or SQLite could reuse archived ids
+    # once the visits table is empty
+    in_range = and_(
+        visits.c.visit_date >= range_start,
+        visits.c.visit_date < range_end,
+        visits.c.id < max_id
+    )
+    if connection.execute(select(visits.c.id).where(in_range).limit(1)).first() is None:
+        connection.commit()
+        return 0
+    
+    table = attach_archive(connection, year, create=True)
+    connection.commit()
+    columns = ['id', 'devotee_id', 'item_id', 'visit_date']
+    connection.execute(
+        insert(table).prefix_with('OR IGNORE').from_select(
+            columns, select(*(visits.c[name] for name in columns)).where(in_range)
+        )
+    )
+    connection.commit()
+    
+    # Only visits that made it into the archive are deleted, not ones
+    # added in the meantime
+    archived = and_(in_range, visits.c.id.in_(select(table.c.id)))
+    summary = ArchivedVisitSummary.__table__
+    upsert = sqlite_insert(summary).from_select(
+        ['devotee_id', 'visit_count', 'first_visit', 'last_visit'],
+        select(
+            visits.c.devotee_id,
+            func.count(visits.c.id),
+            func.min(visits.c.visit_date),
+            func.max(visits.c.visit_date)
+        ).where(archived).group_by(visits.c.devotee_id)
+    )
+    connection.execute(upsert.on_conflict_do_update(
+        index_elements=['devotee_id'],
+        set_={
+            'visit_count': summary.c.visit_count + upsert.excluded.visit_count,
+            'first_visit': func.min(summary.c.first_visit, upsert.excluded.first_visit),
+            'last_visit': func.max(summary.c.last_visit, upsert.excluded.last_visit)
+        }
+    ))
+    
+    count, first_visit, last_visit = connection.execute(
+        select(func.count(visits.c.id), func.min(visits.c.visit_date), func.max(visits.c.visit_date)).where(archived)
+    ).one()
+    connection.execute(Visit.__table__.delete().where(archived))
+    
+    archives = VisitArchive.__table__
+    archived_before = min(range_end.date(), before)
+    upsert = sqlite_insert(archives).values(
+        year=year,
+        filename=archive_filename(year),
+        visit_count=count,
+        first_visit=first_visit,
+        last_visit=last_visit,
+        archived_before=archived_before,
+        updated_at=datetime.now()
+    )
+    connection.execute(upsert.on_conflict_do_update(
+        index_elements=['year'],
+        set_={
+            'visit_count': archives.c.visit_count + upsert.excluded.visit_count,
+            'first_visit': func.min(archives.c.first_visit, upsert.excluded.first_visit),
+            'last_visit': func.max(archives.c.last_visit, upsert.excluded.last_visit),
+            'archived_before': func.max(archives.c.archived_before, upsert.excluded.archived_before),
+            'updated_at': upsert.excluded.updated_at
+        }
+    ))
+    connection.commit()
+    return count
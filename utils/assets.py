@@ -0,0 +1,373 @@
+"""
+Fingerprinted, precompressed static assets
+
+The scripts and the stylesheet of templates/layout.html are bundled,
+minified and written to static/dist under names containing a hash of their
+content (app.3f2a9c1e4b7d.js), each with a gzip and, when the brotli
+package is installed, a brotli variant next to it. manifest.json maps the
+bundle names to the hashed files. A changed file gets a new name, so the
+bundles are served with Cache-Control: immutable and browsers never ask for
+them again.
+
+Bundles are built by `flask build-assets`, or on first use when the
+manifest is missing or older than its source files.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from flask import current_app, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Bundle names mapped to their source files (relative to the static folder), in load order
+BUNDLES = {
+    'app.js': ['js/chart-config.js', 'js/bluetooth.js', 'js/main.js'],
+    'app.css': ['css/style.css']
+}
+
+# Build output, relative to the static folder
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# Precompressed variants by Content-Encoding, in order of preference
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+
+# Characters after which a slash starts a regular expression rather than a division
+_REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^') | {''}
+_RETURN = re.compile(r'\breturn\s?$')
+_WORD_CHARS = re.compile(r'[\w$]')
+# Line breaks next to these can never end a statement
+_NO_BREAK_AFTER = set('{([,;:=')
+_NO_BREAK_BEFORE = set('}]),;:')
+
+def minify_js(source):
+    """
+    Minify JavaScript conservatively.
+    
+    Comments, indentation and blank lines are removed and runs of spaces
+    collapsed. Line breaks are kept, so automatic semicolon insertion works
+    as before, and strings, template literals and regular expressions are
+    copied untouched.
+    
+    Args:
+        source (str): The script
+    
+    Returns:
+        str: The minified script
+    """
+    out = []
+    i = 0
+    length = len(source)
+    last = ''
+    
+    def emit_space(newline):
+        # Collapse whitespace, dropping it where the neighbours don't need it
+        if not out:
+            return
+        if newline:
+            if out[-1] == ' ':
+                out.pop()
+            if out[-1] != '\n':
+                out.append('\n')
+        elif out[-1] not in (' ', '\n'):
+            out.append(' ')
+    
+    def drop_whitespace(char):
+        # Whitespace is only needed between two words or operators that would
+        # merge, and line breaks where a semicolon may be missing
+        if len(out) < 2 or out[-1] not in (' ', '\n'):
+            return
+        before = out[-2][-1]
+        if out[-1] == ' ':
+            needed = (_WORD_CHARS.match(before) and _WORD_CHARS.match(char)) or (before in '+-/' and char in '+-/')
+        else:
+            needed = before not in _NO_BREAK_AFTER and char not in _NO_BREAK_BEFORE
+        if not needed:
+            out.pop()
+    
+    while i < length:
+        char = source[i]
+        
+        if char in ' \t\r\n':
+            start = i
+            while i < length and source[i] in ' \t\r\n':
+                i += 1
+            emit_space('\n' in source[start:i])
+            continue
+        
+        if source.startswith('//', i):
+            while i < length and source[i] != '\n':
+                i += 1
+            continue
+        if source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            i = length if end == -1 else end + 2
+            emit_space(False)
+            continue
+        
+        if char in '\'"`' or (char == '/' and (last in _REGEX_PRECEDERS or _RETURN.search(''.join(out[-8:])))):
+            # Copy strings, template literals and regular expressions verbatim
+            start = i
+            i += 1
+            in_class = False
+            while i < length:
+                if source[i] == '\\':
+                    i += 2
+                    continue
+                if char == '/' and source[i] == '[':
+                    in_class = True
+                elif char == '/' and source[i] == ']':
+                    in_class = False
+                elif source[i] == char and not in_class:
+                    break
+                i += 1
+            i += 1
+            drop_whitespace(char)
+            out.append(source[start:i])
+            last = char
+            continue
+        
+        drop_whitespace(char)
+        out.append(char)
+        last = char
+        i += 1
+    
+    return ''.join(out).strip() + '\n'
+
+def minify_css(source):
+    """
+    Minify a stylesheet: comments and unneeded whitespace are removed.
+    
+    Args:
+        source (str): The stylesheet
+    
+    Returns:
+        str: The minified stylesheet
+    """
+    # Split out strings first so that nothing inside them is touched
+    parts = re.split(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')', source)
+    for index in range(0, len(parts), 2):
+        css = re.sub(r'/\*.*?\*/', '', parts[index], flags=re.S)
+        css = re.sub(r'\s+', ' ', css)
+        css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+        css = re.sub(r':\s+', ':', css)
+        parts[index] = css.replace(';}', '}')
+    return ''.join(parts).strip() + '\n'
+
+MINIFIERS = {
+    '.js': minify_js,
+    '.css': minify_css
+}
+
+def _write_atomic(path, data):
+    # Concurrent builds by several workers write identical files
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.chmod(temp_path, 0o644)
+    os.replace(temp_path, path)
+
+def _source_state(static_folder, bundles):
+    # Modification time and size of every source, to tell when a rebuild is due
+    state = {}
+    for sources in bundles.values():
+        for path in sources:
+            stat = os.stat(os.path.join(static_folder, path))
+            state[path] = [stat.st_mtime_ns, stat.st_size]
+    return state
+
+def build_assets(static_folder, bundles=BUNDLES):
+    """
+    Build the fingerprinted bundles and their manifest.
+    
+    Files of the previous build are kept, for pages still referring to
+    them, and older ones are removed.
+    
+    Args:
+        static_folder (str): The app's static folder
+        bundles (dict): Bundle names mapped to their source files
+    
+    Returns:
+        dict: The manifest, with the hashed file of every bundle (files),
+            the files kept from the previous build (previous) and the state
+            of the sources it was built from (sources)
+    """
+    dist = os.path.join(static_folder, DIST_DIR)
+    os.makedirs(dist, exist_ok=True)
+    previous = read_manifest(static_folder) or {'files': {}}
+    previous_files = sorted(set(previous['files'].values()))
+    
+    files = {}
+    for name, sources in bundles.items():
+        stem, extension = os.path.splitext(name)
+        minify = MINIFIERS.get(extension, lambda text: text)
+        # A semicolon between scripts, in case one ends without it
+        separator = ';\n' if extension == '.js' else ''
+        content = separator.join(
+            minify(open(os.path.join(static_folder, path), encoding='utf-8').read())
+            for path in sources
+        ).encode('utf-8')
+        
+        hashed = f'{stem}.{hashlib.sha256(content).hexdigest()[:12]}{extension}'
+        path = os.path.join(dist, hashed)
+        if not os.path.exists(path):
+            _write_atomic(path, content)
+            _write_atomic(path + '.gz', gzip.compress(content, compresslevel=9, mtime=0))
+            if brotli is not None:
+                _write_atomic(path + '.br', brotli.compress(content))
+        files[name] = hashed
+    
+    manifest = {
+        'files': files,
+        'previous': [filename for filename in previous_files if filename not in files.values()],
+        'sources': _source_state(static_folder, bundles)
+    }
+    _write_atomic(os.path.join(dist, MANIFEST_NAME), json.dumps(manifest, indent=2).encode('utf-8'))
+    
+    keep = set(files.values()) | set(previous_files)
+    for filename in os.listdir(dist):
+        if filename != MANIFEST_NAME and filename.split('.gz')[0].split('.br')[0] not in keep:
+            os.remove(os.path.join(dist, filename))
+    
+    return manifest
+
+def read_manifest(static_folder):
+    """
+    Read the manifest of the last build, None if there is none.
+    """
+    try:
+        with open(os.path.join(static_folder, DIST_DIR, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+class AssetManifest:
+    """
+    The bundle manifest of the running app, built or rebuilt when stale.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._files = None
+        self._servable = frozenset()
+    
+    def files(self, static_folder, check_sources=False):
+        """
+        Get the hashed file of every bundle.
+        
+        Args:
+            static_folder (str): The app's static folder
+            check_sources (bool): Rebuild if the sources changed since the
+                manifest was loaded, e.g. while developing
+        
+        Returns:
+            dict: Bundle names mapped to hashed file names, empty if the
+                bundles could not be built
+        """
+        with self._lock:
+            if self._files is None or check_sources:
+                manifest = read_manifest(static_folder)
+                try:
+                    if manifest is None or manifest.get('sources') != _source_state(static_folder, BUNDLES):
+                        logger.info('Building static asset bundles')
+                        manifest = build_assets(static_folder)
+                except OSError as e:
+                    # E.g. a read-only static folder, the sources are served as they are
+                    logger.warning(f'Could not build static asset bundles: {e}')
+                    manifest = None
+                self._files = manifest['files'] if manifest else {}
+                self._servable = frozenset(self._files.values()) | frozenset(manifest.get('previous', ()) if manifest else ())
+            return self._files
+    
+    def servable(self, static_folder):
+        """
+        Get the hashed files that may be served: the current bundles and
+        those of the previous build, which pages rendered before the last
+        rebuild still refer to.
+        
+        Args:
+            static_folder (str): The app's static folder
+        
+        Returns:
+            frozenset: Hashed file names
+        """
+        self.files(static_folder)
+        return self._servable
+    
+    def invalidate(self):
+        """
+        Drop the loaded manifest so that it is read again on next use.
+        """
+        with self._lock:
+            self._files = None
+
+asset_manifest = AssetManifest()
+
+def find_asset(static_folder, filename, accept_encodings):
+    """
+    Find the file to send for a request of a hashed bundle.
+    
+    Args:
+        static_folder (str): The app's static folder
+        filename (str): The hashed file name
+        accept_encodings: Content codings the client accepts
+    
+    Returns:
+        tuple: The path and the Content-Encoding (None when uncompressed),
+            or None if the file is not a known bundle
+    """
+    if filename not in asset_manifest.servable(static_folder):
+        return None
+    
+    path = os.path.join(static_folder, DIST_DIR, filename)
+    for encoding, suffix in ENCODINGS.items():
+        if encoding in accept_encodings and os.path.exists(path + suffix):
+            return path + suffix, encoding
+    return path, None
+
+def asset_url(filename, **values):
+    """
+    Build the URL of a static file, like url_for('static', filename=...).
+    
+    Bundle names (app.js, app.css) are mapped to their hashed file, served
+    with a far-future Cache-Control by the main.asset route.
+    
+    Args:
+        filename (str): A bundle name or a path in the static folder
+        **values: Further url_for arguments, e.g. _external
+    
+    Returns:
+        str: The URL
+    """
+    static_folder = current_app.static_folder
+    hashed = asset_manifest.files(static_folder, check_sources=current_app.debug).get(filename)
+    if hashed is not None:
+        return url_for('main.asset', filename=hashed, **values)
+    return url_for('static', filename=filename, **values)
+
+def asset_urls(bundle):
+    """
+    Get the URLs to load a bundle from.
+    
+    Args:
+        bundle (str): The bundle name
+    
+    Returns:
+        list: The URL of the hashed bundle, or the URLs of its source files
+            if the bundles could not be built
+    """
+    files = asset_manifest.files(current_app.static_folder, check_sources=current_app.debug)
+    if bundle in files:
+        return [asset_url(bundle)]
+    return [url_for('static', filename=path) for path in BUNDLES[bundle]]
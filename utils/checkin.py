@@ -0,0 +1,221 @@
+"""
+Check-in utilities shared by the check-in routes
+"""
+
+from datetime import datetime, time, timedelta
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from config import Config
+from database import db_session
+from models import Visit
+from utils.archive import archive_cutoff
+from utils.devotee_index import devotee_index
+from utils.item_catalog import item_catalog
+from utils.label_tickets import create_label_tickets
+from utils.printer import generate_prn_template
+from utils.print_spooler import enqueue_print_jobs, get_print_spooler
+from utils.report_cache import report_cache
+from utils.rollup import record_visits
+from utils.visit_counters import record_devotee_visits
+
+# Offline check-ins may be stamped at most this far ahead of the server clock
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+def check_in_devotees(devotee_ids):
+    """
+    Record a visit for each devotee ID in a single transaction.
+    
+    Devotees are resolved through the in-memory devotee index, which also
+    accepts IDs differing in case, whitespace or leading zeros, a random item
+    is drawn from the cached item catalog for each known devotee and all
+    Visit rows are written with one bulk insert.
+    
+    Args:
+        devotee_ids (list): Devotee IDs as entered or scanned at the kiosk
+    
+    Returns:
+        list: One result dict per requested ID, in request order, with a status
+            of 'ok' (plus the print data, with the stored devotee ID, and
+            label_id) or 'not_found'
+    """
+    devotees = devotee_index.resolve_many(set(devotee_ids))
+    
+    now = datetime.now()
+    
+    results = []
+    visit_rows = []
+    for devotee_id in devotee_ids:
+        devotee = devotees.get(devotee_id)
+        if devotee is None:
+            results.append({'devotee_id': devotee_id, 'status': 'not_found'})
+            continue
+        devotee_pk, devotee_id, devotee_name = devotee
+        
+        item_id, item_name = item_catalog.random_item()
+        visit_rows.append({
+            'devotee_id': devotee_pk,
+            'item_id': item_id,
+            'visit_date': now
+        })
+        
+        print_data = {
+            'devotee_id': devotee_id,
+            'devotee_name': devotee_name,
+            'item': item_name,
+            'date': now.strftime('%Y-%m-%d')
+        }
+        print_data['prn_template'] = generate_prn_template(print_data)
+        results.append(dict(print_data, status='ok'))
+    
+    if visit_rows:
+        db_session.execute(insert(Visit), visit_rows)
+        record_visits((row['visit_date'], row['item_id']) for row in visit_rows)
+        record_devotee_visits((row['devotee_id'], row['visit_date']) for row in visit_rows)
+        
+        # Keep the labels server-side, clients only get their ticket IDs
+        checked_in = [result for result in results if result['status'] == 'ok']
+        label_ids = create_label_tickets([
+            {key: value for key, value in result.items() if key != 'status'}
+            for result in checked_in
+        ])
+        for result, label_id in zip(checked_in, label_ids):
+            result['label_id'] = label_id
+        
+        # Queue the labels on the server-side printer in the same transaction
+        if Config.AUTO_PRINT_PRINTER:
+            job_ids = enqueue_print_jobs(
+                Config.AUTO_PRINT_PRINTER,
+                checked_in
+            )
+            for result, job_id in zip(checked_in, job_ids):
+                result['print_job_id'] = job_id
+        
+        db_session.commit()
+        report_cache.invalidate_dates({now.date()})
+        if Config.AUTO_PRINT_PRINTER:
+            get_print_spooler().notify()
+    
+    return results
+
+def _parse_offline_checkin(entry, cutoff=None):
+    if not isinstance(entry, dict):
+        raise ValueError('check-in must be an object')
+    
+    client_id = entry.get('client_id')
+    if not isinstance(client_id, str) or not 0 < len(client_id) <= 64:
+        raise ValueError('client_id must be a string of 1 to 64 characters')
+    devotee_id = entry.get('devotee_id')
+    if not isinstance(devotee_id, str) or not devotee_id.strip():
+        raise ValueError('devotee_id must be a non-empty string')
+    
+    try:
+        visited_at = datetime.fromisoformat(entry.get('visited_at'))
+    except (TypeError, ValueError):
+        raise ValueError('visited_at must be an ISO 8601 date and time')
+    if visited_at.tzinfo is not None:
+        # Visits are stored in the server's local time
+        visited_at = visited_at.astimezone().replace(tzinfo=None)
+    if visited_at > datetime.now() + MAX_CLOCK_SKEW:
+        raise ValueError('visited_at is in the future')
+    if cutoff is not None and visited_at < datetime.combine(cutoff, time.min):
+        # Visits before the cutoff belong in the archives, history reads them first
+        raise ValueError(f'visited_at is before the archive cutoff {cutoff.isoformat()}')
+    
+    item_id = entry.get('item_id')
+    # bool is a subclass of int, but true is no item id
+    if item_id is not None and (not isinstance(item_id, int) or isinstance(item_id, bool) or item_catalog.name(item_id, default=None) is None):
+        raise ValueError('Unknown item_id')
+    
+    return {
+        'client_id': client_id,
+        'devotee_id': devotee_id.strip(),
+        'visited_at': visited_at,
+        'item_id': item_id
+    }
+
+def record_offline_checkins(checkins):
+    """
+    Record check-ins made while a kiosk was offline, in a single transaction.
+    
+    Every check-in carries a client-generated ID that is stored with its
+    visit, so uploading the same check-ins again, e.g. after a lost
+    response, never records a visit twice.
+    
+    Args:
+        checkins (list): Dicts with client_id, devotee_id, visited_at (ISO
+            8601) and optionally the item_id printed on the label, a random
+            item is drawn otherwise
+    
+    Returns:
+        list: One result dict per check-in, in request order, with the
+            client_id and a status of 'ok' or 'duplicate' (both with the
+            visit_id), 'not_found' or 'invalid' (with an error), e.g. for
+            check-ins older than the archive cutoff
+    """
+    cutoff = archive_cutoff()
+    parsed = []
+    for entry in checkins:
+        try:
+            parsed.append(_parse_offline_checkin(entry, cutoff))
+        except ValueError as e:
+            client_id = entry.get('client_id') if isinstance(entry, dict) else None
+            parsed.append({'client_id': client_id, 'status': 'invalid', 'error': str(e)})
+    
+    try:
+        return _record_offline_checkins(parsed)
+    except IntegrityError:
+        # A concurrent upload of the same check-ins committed first, the
+        # retry reports them as duplicates
+        db_session.rollback()
+        return _record_offline_checkins(parsed)
+
+def _record_offline_checkins(parsed):
+    valid = [checkin for checkin in parsed if 'status' not in checkin]
+    client_ids = {checkin['client_id'] for checkin in valid}
+    visit_ids = dict(
+        db_session.query(Visit.client_ref, Visit.id).filter(Visit.client_ref.in_(client_ids))
+    ) if client_ids else {}
+    devotees = devotee_index.resolve_many({checkin['devotee_id'] for checkin in valid})
+    
+    results = []
+    visit_rows = []
+    pending = set()
+    for checkin in parsed:
+        if 'status' in checkin:
+            results.append(dict(checkin))
+            continue
+        
+        client_id = checkin['client_id']
+        result = {'client_id': client_id}
+        devotee = devotees.get(checkin['devotee_id'])
+        if client_id in visit_ids or client_id in pending:
+            result['status'] = 'duplicate'
+        elif devotee is None:
+            result['status'] = 'not_found'
+        else:
+            item_id = checkin['item_id']
+            if item_id is None:
+                item_id, _ = item_catalog.random_item()
+            visit_rows.append({
+                'devotee_id': devotee[0],
+                'item_id': item_id,
+                'visit_date': checkin['visited_at'],
+                'client_ref': client_id
+            })
+            pending.add(client_id)
+            result['status'] = 'ok'
+        results.append(result)
+    
+    if visit_rows:
+        inserted = db_session.execute(insert(Visit).returning(Visit.id, Visit.client_ref), visit_rows).all()
+        visit_ids.update((client_ref, visit_id) for visit_id, client_ref in inserted)
+        record_visits((row['visit_date'], row['item_id']) for row in visit_rows)
+        record_devotee_visits((row['devotee_id'], row['visit_date']) for row in visit_rows)
+        db_session.commit()
+        report_cache.invalidate_dates({row['visit_date'].date() for row in visit_rows})
+    
+    for result in results:
+        if result['status'] in ('ok', 'duplicate'):
+            result['visit_id'] = visit_ids[result['client_id']]
+    return results
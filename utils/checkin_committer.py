@@ -0,0 +1,139 @@
+"""
+Group commit for single check-ins
+
+Many kiosks checking in at once would each hold a write transaction and
+queue up on the database lock. Instead, request threads hand their devotee
+ID to a committer thread and wait for the result. Whatever queued up
+while the committer was busy with the previous batch is recorded with one
+check_in_devotees() call, i.e. one transaction, so a lone check-in isn't
+delayed while a burst of them shares a commit. The committer can also wait
+a few milliseconds for more check-ins to join a batch.
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from config import Config
+from database import db_session
+from utils.checkin import check_in_devotees
+
+logger = logging.getLogger(__name__)
+
+class CheckinCommitter:
+    """
+    A background thread recording queued check-ins in batches.
+    """
+    
+    def __init__(self, max_batch=100, max_wait=0):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+    
+    def start(self):
+        """
+        Start the committer thread if it isn't running.
+        """
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='checkin-committer', daemon=True)
+                self._thread.start()
+    
+    def submit(self, devotee_id):
+        """
+        Queue a check-in.
+        
+        Args:
+            devotee_id (str): The devotee ID as entered or scanned
+        
+        Returns:
+            Future: Resolves to the check_in_devotees() result for the ID
+        """
+        self.start()
+        future = Future()
+        self._queue.put((devotee_id, future))
+        return future
+    
+    def check_in(self, devotee_id, timeout=10):
+        """
+        Check a devotee in and wait for the batch to be committed.
+        
+        A check-in still queued when the timeout expires is withdrawn, so
+        it is never recorded and the client can safely retry. One already
+        being committed is waited for.
+        
+        Raises:
+            TimeoutError: If the check-in wasn't taken up within the timeout
+        """
+        future = self.submit(devotee_id)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            if future.cancel():
+                raise
+            return future.result()
+    
+    def _next_batch(self):
+        # Block for the first check-in, then take whatever arrives shortly after
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        # Drop check-ins whose caller timed out, the rest can no longer be withdrawn
+        return [(devotee_id, future) for devotee_id, future in batch if future.set_running_or_notify_cancel()]
+    
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                results = check_in_devotees([devotee_id for devotee_id, _ in batch])
+            except Exception as e:
+                logger.error(f"Check-in batch of {len(batch)} failed: {e}")
+                db_session.rollback()
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                else:
+                    # Retry one by one, so one bad check-in doesn't fail the others
+                    self._check_in_each(batch)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            finally:
+                db_session.remove()
+    
+    def _check_in_each(self, batch):
+        for devotee_id, future in batch:
+            try:
+                result = check_in_devotees([devotee_id])[0]
+            except Exception as e:
+                db_session.rollback()
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+checkin_committer = None
+_committer_lock = threading.Lock()
+
+def get_checkin_committer():
+    """
+    Get the process-wide check-in committer, created from the configuration.
+    """
+    global checkin_committer
+    with _committer_lock:
+        if checkin_committer is None:
+            checkin_committer = CheckinCommitter(
+                max_batch=Config.CHECKIN_GROUP_SIZE,
+                max_wait=Config.CHECKIN_GROUP_WAIT_MS / 1000
+            )
+    return checkin_committer
@@ -0,0 +1,176 @@
+"""
+In-process index of devotee IDs for the check-in hot path
+
+Check-ins only need a devotee's primary key and name, so the index maps
+every devotee ID to (id, devotee_id, name) and resolves scanned or typed
+IDs without a query. IDs are also matched in a normalized form that
+ignores case, whitespace and leading zeros ("d 0042" finds "D42"), unless
+two devotees share the normalized form. The index is loaded on first use,
+kept up to date with devotees added in this process, and falls back to the
+database for IDs it doesn't know, e.g. devotees added by another worker.
+"""
+
+import re
+import threading
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from database import db_session
+from models import Devotee
+
+# Marks a normalized ID shared by several devotees
+AMBIGUOUS = object()
+
+_LEADING_ZEROS = re.compile(r'(?<!\d)0+(?=\d)')
+
+def normalize_devotee_id(devotee_id):
+    """
+    Normalize a devotee ID for lenient matching.
+    
+    Whitespace is removed, letters are upper-cased and leading zeros are
+    dropped from every run of digits, so " d-0042 " becomes "D-42".
+    
+    Args:
+        devotee_id (str): The ID as entered or scanned
+    
+    Returns:
+        str: The normalized ID
+    """
+    return _LEADING_ZEROS.sub('', ''.join(devotee_id.split()).upper())
+
+class DevoteeIndex:
+    """
+    Devotee IDs mapped to (id, devotee_id, name), plus a normalized lookup.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_id = None
+        self._by_normalized = None
+    
+    def load(self):
+        """
+        (Re)load the index from the database.
+        """
+        by_id = {}
+        by_normalized = {}
+        for pk, devotee_id, name in db_session.query(Devotee.id, Devotee.devotee_id, Devotee.name).yield_per(10000):
+            entry = (pk, devotee_id, name)
+            by_id[devotee_id] = entry
+            self._add_normalized(by_normalized, entry)
+        
+        with self._lock:
+            self._by_id = by_id
+            self._by_normalized = by_normalized
+    
+    def invalidate(self):
+        """
+        Drop the index so that it is reloaded on next use.
+        """
+        with self._lock:
+            self._by_id = None
+            self._by_normalized = None
+    
+    @staticmethod
+    def _add_normalized(by_normalized, entry):
+        key = normalize_devotee_id(entry[1])
+        existing = by_normalized.get(key)
+        if existing is None:
+            by_normalized[key] = entry
+        elif existing is not AMBIGUOUS and existing[1] != entry[1]:
+            by_normalized[key] = AMBIGUOUS
+    
+    def add(self, entries):
+        """
+        Add newly created devotees to the index.
+        
+        Args:
+            entries (iterable): (id, devotee_id, name) tuples
+        """
+        with self._lock:
+            if self._by_id is None:
+                # Not loaded yet, the next load picks them up
+                return
+            for entry in entries:
+                entry = tuple(entry)
+                self._by_id[entry[1]] = entry
+                self._add_normalized(self._by_normalized, entry)
+    
+    def _get_maps(self):
+        with self._lock:
+            maps = self._by_id, self._by_normalized
+        if maps[0] is None:
+            self.load()
+            with self._lock:
+                maps = self._by_id, self._by_normalized
+        return maps
+    
+    def resolve_many(self, devotee_ids):
+        """
+        Resolve devotee IDs as entered or scanned.
+        
+        An exact match wins, then an unambiguous normalized match. IDs that
+        are still unknown are looked up in the database with one query.
+        
+        Args:
+            devotee_ids (iterable): Devotee IDs
+        
+        Returns:
+            dict: Each resolved ID mapped to its (id, devotee_id, name)
+        """
+        by_id, by_normalized = self._get_maps()
+        resolved = {}
+        missing = set()
+        for devotee_id in devotee_ids:
+            entry = by_id.get(devotee_id)
+            if entry is None:
+                entry = by_normalized.get(normalize_devotee_id(devotee_id))
+                if entry is AMBIGUOUS:
+                    entry = None
+            if entry is None:
+                missing.add(devotee_id)
+            else:
+                resolved[devotee_id] = entry
+        
+        if missing:
+            found = [
+                tuple(row) for row in db_session.query(
+                    Devotee.id, Devotee.devotee_id, Devotee.name
+                ).filter(Devotee.devotee_id.in_(missing))
+            ]
+            self.add(found)
+            for entry in found:
+                resolved[entry[1]] = entry
+        return resolved
+    
+    def resolve(self, devotee_id):
+        """
+        Resolve one devotee ID, see resolve_many().
+        
+        Returns:
+            tuple: (id, devotee_id, name), or None if there is no such devotee
+        """
+        return self.resolve_many([devotee_id]).get(devotee_id)
+
+devotee_index = DevoteeIndex()
+
+@event.listens_for(Session, 'after_flush')
+def _track_devotee_changes(session, flush_context):
+    for obj in session.new:
+        if isinstance(obj, Devotee):
+            session.info.setdefault('new_devotees', []).append((obj.id, obj.devotee_id, obj.name))
+    if any(isinstance(obj, Devotee) for obj in session.dirty | session.deleted):
+        session.info['devotees_changed'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _update_on_commit(session):
+    new_devotees = session.info.pop('new_devotees', None)
+    if session.info.pop('devotees_changed', False):
+        devotee_index.invalidate()
+    elif new_devotees:
+        devotee_index.add(new_devotees)
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_devotee_changes(session):
+    session.info.pop('new_devotees', None)
+    session.info.pop('devotees_changed', None)
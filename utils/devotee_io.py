@@ -0,0 +1,248 @@
+"""
+Bulk import and export of devotees and visits (CSV or JSON Lines)
+
+Imports are streamed in chunks: existing devotee IDs are loaded once into a
+set, every record is validated and deduplicated against it, and each chunk
+is written with one bulk insert in its own transaction. Exports stream rows
+from the database without loading whole tables into memory.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime, time, timedelta
+from sqlalchemy import insert, select
+
+from database import db_session
+from models import Devotee, Visit
+from utils.archive import archived_visit_tables
+from utils.devotee_index import devotee_index
+from utils.item_catalog import item_catalog
+from utils.sync import next_sync_version
+
+FORMATS = ('csv', 'jsonl')
+
+# Devotee fields accepted on import, with their maximum lengths
+DEVOTEE_FIELDS = {
+    'devotee_id': 20,
+    'name': 100,
+    'phone': 20,
+    'email': 120,
+    'address': 200
+}
+
+# At most this many invalid records are reported back individually
+MAX_REPORTED_ERRORS = 20
+
+def read_records(stream, fmt):
+    """
+    Iterate over the records of a CSV or JSON Lines text stream.
+    
+    A row or line that cannot be parsed is yielded as a ValueError in place
+    of its record, so that the import goes on with the next one.
+    
+    Args:
+        stream: A text stream
+        fmt (str): csv or jsonl
+    
+    Yields:
+        tuple: The line number and the record (a dict) of every row or line
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        while True:
+            try:
+                record = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                # line_num is not advanced past the row that failed
+                yield reader.line_num + 1, ValueError(f'invalid CSV: {e}')
+                continue
+            yield reader.line_num, record
+    elif fmt == 'jsonl':
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                yield number, json.loads(line)
+            except ValueError as e:
+                yield number, ValueError(f'invalid JSON: {e}')
+    else:
+        raise ValueError(f'Unknown format: {fmt}')
+
+def _clean_devotee(record):
+    # Returns the row to insert, or raises ValueError describing the problem
+    if isinstance(record, ValueError):
+        raise record
+    if not isinstance(record, dict):
+        raise ValueError('record is not an object')
+    
+    row = {}
+    for field, max_length in DEVOTEE_FIELDS.items():
+        value = record.get(field)
+        value = str(value).strip() if value is not None else ''
+        if len(value) > max_length:
+            raise ValueError(f'{field} is longer than {max_length} characters')
+        row[field] = value or None
+    
+    if not row['devotee_id']:
+        raise ValueError('devotee_id is required')
+    if not row['name']:
+        raise ValueError('name is required')
+    return row
+
+def import_devotees(records, chunk_size=1000, progress=None):
+    """
+    Import devotees in chunks, skipping IDs that already exist.
+    
+    Unparsable and invalid records are counted and skipped. If the file
+    cannot be read any further, e.g. because it is not UTF-8, the import
+    stops there, and the chunks inserted so far stay committed.
+    
+    Args:
+        records (iterable): (line number, devotee dict) pairs from read_records()
+        chunk_size (int): Number of devotees inserted per transaction
+        progress (callable): Called with the summary after every chunk
+    
+    Returns:
+        dict: Counts of read, imported, duplicate and invalid records, and
+            the first few errors with their record and line numbers
+    """
+    known_ids = set(db_session.execute(select(Devotee.devotee_id)).scalars())
+    summary = {'read': 0, 'imported': 0, 'duplicates': 0, 'invalid': 0, 'errors': []}
+    chunk = []
+    
+    def flush():
+        if chunk:
+            version = next_sync_version(db_session)
+            created = db_session.execute(
+                insert(Devotee).returning(Devotee.id, Devotee.devotee_id, Devotee.name),
+                [dict(row, sync_version=version) for row in chunk]
+            ).all()
+            db_session.commit()
+            devotee_index.add(created)
+            summary['imported'] += len(chunk)
+            chunk.clear()
+        if progress:
+            progress(summary)
+    
+    def reject(number, line, error):
+        summary['invalid'] += 1
+        if len(summary['errors']) < MAX_REPORTED_ERRORS:
+            summary['errors'].append({'record': number, 'line': line, 'error': error})
+    
+    number = line = 0
+    records = iter(records)
+    while True:
+        try:
+            line, record = next(records)
+        except StopIteration:
+            break
+        except ValueError as e:
+            # E.g. a UnicodeDecodeError, the rest of the file is lost
+            summary['read'] += 1
+            reject(number + 1, line + 1, f'could not read the rest of the file: {e}')
+            break
+        
+        number += 1
+        summary['read'] += 1
+        try:
+            row = _clean_devotee(record)
+        except ValueError as e:
+            reject(number, line, str(e))
+            continue
+        
+        if row['devotee_id'] in known_ids:
+            summary['duplicates'] += 1
+            continue
+        
+        known_ids.add(row['devotee_id'])
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            flush()
+    
+    flush()
+    return summary
+
+def _stream_rows(columns, rows, fmt, batch_size=1000):
+    # Serialize rows batch by batch, yielding one string per batch
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        count = 0
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+            if count % batch_size == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    elif fmt == 'jsonl':
+        lines = []
+        for row in rows:
+            lines.append(json.dumps(dict(zip(columns, row))) + '\n')
+            if len(lines) == batch_size:
+                yield ''.join(lines)
+                lines = []
+        yield ''.join(lines)
+    else:
+        raise ValueError(f'Unknown format: {fmt}')
+
+def export_devotees(fmt='csv'):
+    """
+    Stream all devotees as CSV or JSON Lines.
+    
+    Yields:
+        str: Chunks of the export
+    """
+    columns = ('devotee_id', 'name', 'phone', 'email', 'address', 'created_at')
+    rows = (
+        (devotee_id, name, phone, email, address, created_at.isoformat() if created_at else None)
+        for devotee_id, name, phone, email, address, created_at in db_session.query(
+            Devotee.devotee_id, Devotee.name, Devotee.phone,
+            Devotee.email, Devotee.address, Devotee.created_at
+        ).order_by(Devotee.id).yield_per(1000)
+    )
+    return _stream_rows(columns, rows, fmt)
+
+def export_visits(fmt='csv', start=None, end=None):
+    """
+    Stream visits as CSV or JSON Lines, optionally limited to a date range.
+    
+    Archived visits are included, ahead of the visits table.
+    
+    Args:
+        fmt (str): csv or jsonl
+        start (date): Only export visits on or after this date
+        end (date): Only export visits on or before this date
+    
+    Yields:
+        str: Chunks of the export
+    """
+    def visits_query(table, *conditions):
+        query = db_session.query(
+            table.c.id, Devotee.devotee_id, table.c.item_id, table.c.visit_date
+        ).join(
+            Devotee, Devotee.id == table.c.devotee_id
+        ).filter(*conditions).order_by(table.c.id)
+        if start is not None:
+            query = query.filter(table.c.visit_date >= datetime.combine(start, time.min))
+        if end is not None:
+            query = query.filter(table.c.visit_date < datetime.combine(end + timedelta(days=1), time.min))
+        return query
+    
+    def all_visits():
+        # Archived visits first, the archives are only attached if the range needs them
+        for table, archived in archived_visit_tables(start, end):
+            yield from visits_query(table, archived).yield_per(1000)
+        yield from visits_query(Visit.__table__).yield_per(1000)
+    
+    columns = ('visit_id', 'devotee_id', 'item', 'visit_date')
+    rows = (
+        (visit_id, devotee_id, item_catalog.name(item_id), visit_date.isoformat())
+        for visit_id, devotee_id, item_id, visit_date in all_visits()
+    )
+    return _stream_rows(columns, rows, fmt)
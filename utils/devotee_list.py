@@ -0,0 +1,87 @@
+"""
+Paginated, searchable devotee list
+"""
+
+from datetime import datetime, time
+from sqlalchemy import func, or_
+
+from database import db_session
+from models import Devotee
+
+# Upper bound for prefix ranges: sorts after any character that can follow the prefix
+PREFIX_END = '\U0010ffff'
+
+def _prefix_filter(query):
+    # Ranges on lower(...) and phone so that each term is answered by an index
+    prefix = query.strip().lower()
+    return or_(
+        func.lower(Devotee.devotee_id).between(prefix, prefix + PREFIX_END),
+        func.lower(Devotee.name).between(prefix, prefix + PREFIX_END),
+        Devotee.phone.between(query.strip(), query.strip() + PREFIX_END)
+    )
+
+def list_devotees(search=None, after=None, limit=50):
+    """
+    Get one page of devotees ordered by devotee ID.
+    
+    Args:
+        search (str): Case-insensitive prefix of the devotee ID, name or phone
+        after (str): Only return devotees whose devotee ID sorts after this one
+        limit (int): Maximum number of devotees to return
+    
+    Returns:
+        dict: The devotees on the page and the next_after cursor, which is
+            None on the last page
+    """
+    rows = devotee_list_query(search=search, after=after, limit=limit).all()
+    
+    return {
+        'devotees': [
+            {
+                'devotee_id': devotee_id,
+                'name': name,
+                'phone': phone,
+                'email': email
+            }
+            for devotee_id, name, phone, email in rows
+        ],
+        'next_after': rows[-1].devotee_id if len(rows) == limit else None
+    }
+
+def devotee_list_query(search=None, after=None, limit=50):
+    """
+    Build the query for one page of the devotee list.
+    """
+    query = db_session.query(
+        Devotee.devotee_id, Devotee.name, Devotee.phone, Devotee.email
+    )
+    if search:
+        query = query.filter(_prefix_filter(search))
+    if after is not None:
+        query = query.filter(Devotee.devotee_id > after)
+    
+    return query.order_by(Devotee.devotee_id).limit(limit)
+
+def count_devotees(search=None):
+    """
+    Count devotees, optionally only those matching a search prefix.
+    """
+    query = db_session.query(func.count(Devotee.id))
+    if search:
+        query = query.filter(_prefix_filter(search))
+    return query.scalar()
+
+def count_active_devotees(since):
+    """
+    Count devotees who visited on or after a date.
+    """
+    return active_devotees_query(since).scalar()
+
+def active_devotees_query(since):
+    """
+    Build the count of devotees last seen on or after a date, a range read
+    on ix_devotees_last_visit_at.
+    """
+    return db_session.query(func.count(Devotee.id)).filter(
+        Devotee.last_visit_at >= datetime.combine(since, time.min)
+    )
@@ -0,0 +1,100 @@
+"""
+In-process cache of the item catalog
+
+Items change rarely but are needed on every check-in and whenever visits are
+shown with their item names. The catalog keeps item ids and names in compact
+arrays so the hot paths never query the items table. It is reloaded lazily
+after any committed change to an Item.
+"""
+
+import random
+import threading
+from array import array
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from database import db_session
+from models import Item
+
+class ItemCatalog:
+    """
+    Item ids and names held in parallel arrays, with an id -> position map.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+    
+    def load(self):
+        """
+        (Re)load the catalog from the database.
+        """
+        rows = db_session.query(Item.id, Item.name).order_by(Item.id).all()
+        ids = array('q', (item_id for item_id, _ in rows))
+        names = tuple(name for _, name in rows)
+        positions = {item_id: index for index, item_id in enumerate(ids)}
+        
+        with self._lock:
+            self._snapshot = (ids, names, positions)
+    
+    def invalidate(self):
+        """
+        Drop the cached catalog so that it is reloaded on next use.
+        """
+        with self._lock:
+            self._snapshot = None
+    
+    def _get_snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.load()
+            snapshot = self._snapshot
+        return snapshot
+    
+    def random_item(self):
+        """
+        Pick a random item.
+        
+        Returns:
+            tuple: The (id, name) of the selected item
+        
+        Raises:
+            LookupError: If there are no items
+        """
+        ids, names, _ = self._get_snapshot()
+        if not ids:
+            raise LookupError('The item catalog is empty')
+        index = random.randrange(len(ids))
+        return ids[index], names[index]
+    
+    def name(self, item_id, default='Unknown'):
+        """
+        Get the name of an item by its primary key.
+        """
+        _, names, positions = self._get_snapshot()
+        index = positions.get(item_id)
+        return names[index] if index is not None else default
+    
+    def items(self):
+        """
+        Get all items as a list of (id, name) pairs ordered by id.
+        """
+        ids, names, _ = self._get_snapshot()
+        return list(zip(ids, names))
+
+item_catalog = ItemCatalog()
+
+@event.listens_for(Session, 'after_flush')
+def _track_item_changes(session, flush_context):
+    changed = session.new | session.dirty | session.deleted
+    if any(isinstance(obj, Item) for obj in changed):
+        session.info['items_changed'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    if session.info.pop('items_changed', False):
+        item_catalog.invalidate()
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_item_changes(session):
+    session.info.pop('items_changed', None)
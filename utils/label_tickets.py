@@ -0,0 +1,82 @@
+"""
+Server-side storage of check-in labels
+
+Each check-in stores its print data (including the PRN commands) in the
+label_tickets table under a random ticket ID. Pages and API clients only
+carry the ID and fetch the label when they need it, so nothing large ends
+up in the session cookie. Tickets expire after Config.LABEL_TICKET_TTL.
+"""
+
+import json
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, insert
+
+from config import Config
+from database import db_session
+from models import LabelTicket
+
+# Expired tickets are purged at most this often (seconds) per process
+PURGE_INTERVAL = 60
+
+_purge_lock = threading.Lock()
+_last_purge = 0.0
+
+def create_label_tickets(labels):
+    """
+    Store labels within the current transaction.
+    
+    The caller is responsible for committing.
+    
+    Args:
+        labels (list): Print data dicts, one per label
+    
+    Returns:
+        list: The ticket IDs, in the same order as the labels
+    """
+    now = datetime.now()
+    expires_at = now + timedelta(seconds=Config.LABEL_TICKET_TTL)
+    ticket_ids = [secrets.token_hex(16) for _ in labels]
+    
+    if labels:
+        db_session.execute(insert(LabelTicket), [
+            {
+                'id': ticket_id,
+                'payload': json.dumps(label),
+                'created_at': now,
+                'expires_at': expires_at
+            }
+            for ticket_id, label in zip(ticket_ids, labels)
+        ])
+        _purge_expired(now)
+    
+    return ticket_ids
+
+def get_label(ticket_id):
+    """
+    Get the print data stored under a ticket ID.
+    
+    Returns:
+        dict: The print data, or None if the ticket is unknown or expired
+    """
+    if not ticket_id:
+        return None
+    
+    ticket = db_session.query(
+        LabelTicket.payload, LabelTicket.expires_at
+    ).filter(LabelTicket.id == ticket_id).first()
+    if ticket is None or ticket.expires_at < datetime.now():
+        return None
+    
+    return json.loads(ticket.payload)
+
+def _purge_expired(now):
+    global _last_purge
+    with _purge_lock:
+        if time.monotonic() - _last_purge < PURGE_INTERVAL:
+            return
+        _last_purge = time.monotonic()
+    
+    db_session.execute(delete(LabelTicket).where(LabelTicket.expires_at < now))
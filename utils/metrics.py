@@ -0,0 +1,193 @@
+"""
+Request and SQL query instrumentation
+
+The engine hooks in database.py report every query here and the request
+hooks in app.py report every request. Per-request query counts and SQL time
+are kept in a thread-local, so they can be sent back in a Server-Timing
+header, and process-wide histograms are rendered in the Prometheus text
+format for /api/metrics.
+"""
+
+import bisect
+import threading
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+class Histogram:
+    """
+    A thread-safe Prometheus-style histogram, optionally split by labels.
+    """
+    
+    def __init__(self, name, help_text, buckets, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label_names = tuple(label_names)
+        self._series = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value, *label_values):
+        """
+        Record a value for the given label values.
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Bucket counts (plus +Inf), then the sum of all values
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+    
+    def render(self):
+        """
+        Render the histogram in the Prometheus text format.
+        
+        Returns:
+            list: The lines of the exposition
+        """
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        
+        for label_values, counts, total in series:
+            labels = _format_labels(self.label_names, label_values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                bucket_labels = _format_labels(self.label_names + ('le',), label_values + (str(bound),))
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            lines.append(f'{self.name}_sum{labels} {total:.6f}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+class Counter:
+    """
+    A thread-safe Prometheus-style counter, optionally split by labels.
+    """
+    
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+    
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items()) or ([((), 0)] if not self.label_names else [])
+        for label_values, value in values:
+            lines.append(f'{self.name}{_format_labels(self.label_names, label_values)} {value}')
+        return lines
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+request_duration = Histogram(
+    'temple_http_request_duration_seconds',
+    'Time spent handling requests, by endpoint.',
+    LATENCY_BUCKETS,
+    ('method', 'endpoint')
+)
+request_queries = Histogram(
+    'temple_http_request_db_queries',
+    'Number of SQL queries per request, by endpoint.',
+    QUERY_COUNT_BUCKETS,
+    ('method', 'endpoint')
+)
+request_db_time = Histogram(
+    'temple_http_request_db_seconds',
+    'Time spent in SQL queries per request, by endpoint.',
+    LATENCY_BUCKETS,
+    ('method', 'endpoint')
+)
+requests_total = Counter(
+    'temple_http_requests_total',
+    'Requests handled, by endpoint and status code.',
+    ('method', 'endpoint', 'status')
+)
+query_duration = Histogram(
+    'temple_db_query_duration_seconds',
+    'Time spent executing SQL queries, including those outside requests.',
+    LATENCY_BUCKETS
+)
+slow_queries_total = Counter(
+    'temple_db_slow_queries_total',
+    'SQL queries slower than the slow query threshold.'
+)
+
+_request_stats = threading.local()
+
+def start_request():
+    """
+    Start counting the queries of the request handled by this thread.
+    """
+    _request_stats.queries = 0
+    _request_stats.db_time = 0.0
+
+def record_query(seconds, slow=False):
+    """
+    Record one executed SQL query.
+    
+    Args:
+        seconds (float): Time the query took
+        slow (bool): Whether it exceeded the slow query threshold
+    """
+    query_duration.observe(seconds)
+    if slow:
+        slow_queries_total.inc()
+    if getattr(_request_stats, 'queries', None) is not None:
+        _request_stats.queries += 1
+        _request_stats.db_time += seconds
+
+def finish_request(method, endpoint, status, seconds):
+    """
+    Record a finished request and stop counting its queries.
+    
+    Args:
+        method (str): HTTP method
+        endpoint (str): Flask endpoint name
+        status (int): Response status code
+        seconds (float): Time the request took
+    
+    Returns:
+        tuple: Number of queries and seconds spent in SQL for the request
+    """
+    queries = getattr(_request_stats, 'queries', None) or 0
+    db_time = getattr(_request_stats, 'db_time', None) or 0.0
+    _request_stats.queries = None
+    _request_stats.db_time = None
+    
+    request_duration.observe(seconds, method, endpoint)
+    request_queries.observe(queries, method, endpoint)
+    request_db_time.observe(db_time, method, endpoint)
+    requests_total.inc(method, endpoint, str(status))
+    return queries, db_time
+
+def render_metrics(extra=()):
+    """
+    Render all metrics in the Prometheus text format.
+    
+    Args:
+        extra (iterable): Additional unlabelled metrics as
+            (name, type, help text, value) tuples
+    
+    Returns:
+        str: The exposition text
+    """
+    lines = []
+    for metric in (request_duration, request_queries, request_db_time, requests_total, query_duration, slow_queries_total):
+        lines.extend(metric.render())
+    for name, metric_type, help_text, value in extra:
+        lines.extend([f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}', f'{name} {value}'])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,338 @@
+"""
+Server-side print spooler
+
+Labels are queued as rows in the print_jobs table and sent to the printers
+by a pool of worker threads, so a check-in never waits for a printer. Each
+time a worker picks a printer it takes every queued job for that printer,
+renders their labels into one reused buffer and sends them as one write.
+Failed jobs are retried up to a limit.
+
+Printers are raw byte sinks addressed by URL:
+    tcp://host:port     a network label printer (usually port 9100)
+    file:///path        appends each job to a file, a stand-in for testing
+"""
+
+import json
+import logging
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+from sqlalchemy import insert, update
+
+from config import Config
+from database import db_session
+from models import PrintJob
+from utils.printer import default_label_template
+
+logger = logging.getLogger(__name__)
+
+class TcpPrinter:
+    """
+    A printer reached over a raw TCP socket.
+    """
+    
+    def __init__(self, host, port=9100, timeout=10):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+    
+    def send(self, payload):
+        with socket.create_connection((self.host, self.port), timeout=self.timeout) as connection:
+            connection.sendall(payload)
+
+class FilePrinter:
+    """
+    A file that printer jobs are appended to.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+    
+    def send(self, payload):
+        with open(self.path, 'ab') as f:
+            f.write(payload)
+
+def open_printer(url):
+    """
+    Create the printer backend for a printer URL.
+    
+    Args:
+        url (str): tcp://host:port or file:///path
+    
+    Returns:
+        TcpPrinter or FilePrinter
+    
+    Raises:
+        ValueError: If the URL scheme is not supported
+    """
+    parsed = urlparse(url)
+    if parsed.scheme == 'tcp':
+        return TcpPrinter(parsed.hostname, parsed.port or 9100)
+    elif parsed.scheme == 'file':
+        return FilePrinter(parsed.netloc + parsed.path)
+    raise ValueError(f'Unsupported printer URL: {url}')
+
+def enqueue_print_jobs(printer, labels):
+    """
+    Queue printer jobs within the current transaction.
+    
+    Jobs store the label fields, the PRN commands are rendered when the
+    job is printed. The caller is responsible for committing and then
+    calling print_spooler.notify() to wake up the workers.
+    
+    Args:
+        printer (str): Name of the printer, a key of Config.PRINTERS
+        labels (list): Label data dicts, as for generate_prn_template
+    
+    Returns:
+        list: The ids of the new jobs, in order
+    """
+    now = datetime.now()
+    return list(db_session.execute(
+        insert(PrintJob).returning(PrintJob.id, sort_by_parameter_order=True),
+        [
+            {
+                'printer': printer,
+                'payload': json.dumps({
+                    field: label[field] for field in default_label_template.fields if field in label
+                }),
+                'status': 'queued',
+                'attempts': 0,
+                'created_at': now,
+                'updated_at': now
+            }
+            for label in labels
+        ]
+    ).scalars())
+
+def render_jobs_into(buffer, jobs):
+    """
+    Render the labels of print jobs back to back into a byte buffer.
+    
+    Args:
+        buffer (bytearray): The buffer to append to
+        jobs (list): PrintJob rows
+    """
+    labels = []
+    for job in jobs:
+        try:
+            label = json.loads(job.payload)
+        except ValueError:
+            label = None
+        if isinstance(label, dict):
+            labels.append(label)
+            continue
+        # Queued before jobs stored label fields, the payload is PRN already
+        default_label_template.render_batch(labels, buffer)
+        labels.clear()
+        buffer += job.payload.encode('utf-8')
+    default_label_template.render_batch(labels, buffer)
+
+def print_job_to_dict(job):
+    """
+    Convert a PrintJob to its JSON representation (without the payload).
+    """
+    return {
+        'id': job.id,
+        'printer': job.printer,
+        'status': job.status,
+        'attempts': job.attempts,
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'printed_at': job.printed_at.isoformat() if job.printed_at else None
+    }
+
+class PrintSpooler:
+    """
+    A pool of worker threads sending queued print jobs to their printers.
+    
+    A printer is only ever served by one worker at a time, so jobs for the
+    same printer are printed in order.
+    """
+    
+    def __init__(self, printers, workers=2, max_attempts=3, poll_interval=1.0, batch_size=50):
+        self.printers = {name: open_printer(url) for name, url in printers.items()}
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        
+        self._lock = threading.Lock()
+        self._busy = set()
+        self._retry_after = {}
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+    
+    def start(self):
+        """
+        Start the worker threads.
+        """
+        if self._threads or not self.printers:
+            return
+        self.requeue_stale_jobs()
+        self._stopping.clear()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'print-spooler-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Print spooler started with {self.workers} workers for {', '.join(self.printers)}")
+    
+    def requeue_stale_jobs(self, older_than=timedelta(minutes=5)):
+        """
+        Put jobs left in 'printing' by a stopped spooler back in the queue.
+        """
+        db_session.execute(
+            update(PrintJob).where(
+                PrintJob.status == 'printing',
+                PrintJob.updated_at < datetime.now() - older_than
+            ).values(
+                status='queued',
+                claimed_by=None
+            ).execution_options(synchronize_session=False)
+        )
+        db_session.commit()
+        db_session.remove()
+    
+    def stop(self, timeout=5):
+        """
+        Stop the worker threads after their current job.
+        """
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+    
+    def notify(self):
+        """
+        Wake up idle workers, e.g. after queuing new jobs.
+        """
+        self._wakeup.set()
+    
+    def _run(self):
+        # Every job of a batch is rendered into this buffer, reused across batches
+        buffer = bytearray()
+        while not self._stopping.is_set():
+            try:
+                worked = self._work_once(buffer)
+            except Exception as e:
+                logger.error(f"Print spooler error: {e}")
+                db_session.rollback()
+                worked = False
+            finally:
+                db_session.remove()
+            
+            if not worked:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+    
+    def _acquire_printer(self):
+        # Pick the printer with the oldest queued job that nobody is serving
+        now = time.monotonic()
+        with self._lock:
+            available = [
+                name for name in self.printers
+                if name not in self._busy and self._retry_after.get(name, 0) <= now
+            ]
+            if not available:
+                return None
+            
+            oldest = db_session.query(PrintJob.printer).filter(
+                PrintJob.status == 'queued',
+                PrintJob.printer.in_(available)
+            ).order_by(PrintJob.id).first()
+            db_session.commit()
+            if oldest is None:
+                return None
+            
+            self._busy.add(oldest.printer)
+            return oldest.printer
+    
+    def _claim_jobs(self, printer):
+        # Mark the queued jobs as ours; the status check keeps another
+        # spooler process from claiming the same jobs
+        token = uuid.uuid4().hex
+        job_ids = [
+            job_id for job_id, in db_session.query(PrintJob.id).filter(
+                PrintJob.status == 'queued',
+                PrintJob.printer == printer
+            ).order_by(PrintJob.id).limit(self.batch_size)
+        ]
+        db_session.execute(
+            update(PrintJob).where(
+                PrintJob.id.in_(job_ids),
+                PrintJob.status == 'queued'
+            ).values(
+                status='printing',
+                claimed_by=token,
+                updated_at=datetime.now()
+            ).execution_options(synchronize_session=False)
+        )
+        db_session.commit()
+        
+        return db_session.query(PrintJob).filter(
+            PrintJob.claimed_by == token,
+            PrintJob.status == 'printing'
+        ).order_by(PrintJob.id).all()
+    
+    def _work_once(self, buffer):
+        printer = self._acquire_printer()
+        if printer is None:
+            return False
+        
+        try:
+            jobs = self._claim_jobs(printer)
+            if not jobs:
+                return False
+            
+            # One write for all queued labels of this printer
+            buffer.clear()
+            render_jobs_into(buffer, jobs)
+            try:
+                self.printers[printer].send(buffer)
+            except Exception as e:
+                self._fail_jobs(printer, jobs, e)
+            else:
+                now = datetime.now()
+                for job in jobs:
+                    job.status = 'done'
+                    job.printed_at = now
+                    job.attempts += 1
+                db_session.commit()
+            return True
+        finally:
+            with self._lock:
+                self._busy.discard(printer)
+    
+    def _fail_jobs(self, printer, jobs, error):
+        logger.error(f"Printing {len(jobs)} job(s) on {printer} failed: {error}")
+        for job in jobs:
+            job.attempts += 1
+            job.error = str(error)[:200]
+            job.status = 'failed' if job.attempts >= self.max_attempts else 'queued'
+        db_session.commit()
+        
+        # Back off before trying this printer again
+        with self._lock:
+            self._retry_after[printer] = time.monotonic() + self.poll_interval * 5
+
+print_spooler = None
+
+def get_print_spooler():
+    """
+    Get the process-wide print spooler, created from the configuration.
+    """
+    global print_spooler
+    if print_spooler is None:
+        print_spooler = PrintSpooler(
+            Config.PRINTERS,
+            workers=Config.PRINT_WORKERS,
+            max_attempts=Config.PRINT_MAX_ATTEMPTS,
+            poll_interval=Config.PRINT_POLL_INTERVAL,
+            batch_size=Config.PRINT_BATCH_SIZE
+        )
+    return print_spooler
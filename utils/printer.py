@@ -2,6 +2,142 @@
 Utility functions for generating printer-compatible content
 """
 
+import re
+from functools import lru_cache
+
+# This is a simplified example of a PRN template for a generic barcode printer
+# Real PRN templates will vary based on your specific printer model
+DEFAULT_PRN_TEMPLATE = """
+N
+D11
+B50,20,0,1,2,8,40,B,"{devotee_id}"
+A60,70,0,3,1,1,N,"{devotee_name}"
+A60,100,0,3,1,1,N,"Item: {item}"
+A60,130,0,2,1,1,N,"Date: {date}"
+P1
+"""
+
+# Values printed when a label field is missing
+DEFAULT_LABEL_FIELDS = {
+    'devotee_id': 'Unknown',
+    'devotee_name': 'Unknown',
+    'item': 'Unknown Item',
+    'date': 'Unknown Date'
+}
+
+PLACEHOLDER_PATTERN = re.compile(r'\{(\w+)\}')
+
+def escape_prn_value(value):
+    """
+    Escape a value for use inside a double-quoted PRN (EPL) string.
+    
+    Backslashes and double quotes are escaped, and line breaks are replaced
+    with spaces since they would end the printer command.
+    """
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('"', '\\"')
+        .replace('\r', ' ')
+        .replace('\n', ' ')
+    )
+
+class LabelTemplate:
+    """
+    A PRN template parsed once into literal chunks and {field} slots.
+    
+    Rendering only escapes and joins the field values, so a label costs a
+    few appends instead of re-parsing or re-formatting the template.
+    """
+    
+    def __init__(self, template, defaults=None, encoding='utf-8'):
+        self.template = template
+        self.defaults = dict(defaults or {})
+        self.encoding = encoding
+        
+        # Alternating parts: literal text at even positions, field names at odd ones
+        self._parts = PLACEHOLDER_PATTERN.split(template)
+        self._encoded_literals = [part.encode(encoding) for part in self._parts[::2]]
+        self.fields = tuple(self._parts[1::2])
+    
+    def _values(self, data):
+        for name in self.fields:
+            if name in data:
+                yield escape_prn_value(data[name])
+            elif name in self.defaults:
+                yield escape_prn_value(self.defaults[name])
+            else:
+                # Leave unknown placeholders untouched
+                yield '{' + name + '}'
+    
+    def render_text(self, data):
+        """
+        Render a label as a string.
+        
+        Args:
+            data (dict): Field values for the label
+        
+        Returns:
+            str: The PRN commands for the label
+        """
+        literals = self._parts[::2]
+        out = [literals[0]]
+        for value, literal in zip(self._values(data), literals[1:]):
+            out.append(value)
+            out.append(literal)
+        return ''.join(out)
+    
+    def render_into(self, buffer, data):
+        """
+        Append the encoded label to a byte buffer.
+        
+        Args:
+            buffer (bytearray): The buffer to append to, e.g. a printer job
+            data (dict): Field values for the label
+        """
+        literals = self._encoded_literals
+        buffer += literals[0]
+        for value, literal in zip(self._values(data), literals[1:]):
+            buffer += value.encode(self.encoding, 'replace')
+            buffer += literal
+    
+    def render(self, data):
+        """
+        Render one label as bytes ready to send to the printer.
+        """
+        buffer = bytearray()
+        self.render_into(buffer, data)
+        return bytes(buffer)
+    
+    def render_batch(self, records, buffer=None):
+        """
+        Render several labels into one printer job.
+        
+        Each label keeps its own N ... P1 block, and the blocks are written
+        back to back into one stream so they can be sent in a single write.
+        
+        Args:
+            records (iterable): Field value dicts, one per label
+            buffer (bytearray): Buffer to reuse, a new one is created if omitted
+        
+        Returns:
+            bytearray: The printer job
+        """
+        if buffer is None:
+            buffer = bytearray()
+        for data in records:
+            self.render_into(buffer, data)
+        return buffer
+
+@lru_cache(maxsize=32)
+def compile_template(template, encoding='utf-8'):
+    """
+    Get the compiled LabelTemplate for a template string, cached by content.
+    """
+    return LabelTemplate(template, encoding=encoding)
+
+default_label_template = LabelTemplate(DEFAULT_PRN_TEMPLATE, defaults=DEFAULT_LABEL_FIELDS)
+
 def generate_prn_template(data):
     """
     Generate a PRN template for a barcode printer.
@@ -16,28 +152,19 @@ def generate_prn_template(data):
     Returns:
         str: The PRN template with data inserted
     """
-    # This is a simplified example of a PRN template for a generic barcode printer
-    # Real PRN templates will vary based on your specific printer model
-    
-    # Extract data with defaults
-    devotee_id = data.get('devotee_id', 'Unknown')
-    devotee_name = data.get('devotee_name', 'Unknown')
-    item = data.get('item', 'Unknown Item')
-    date = data.get('date', 'Unknown Date')
+    return default_label_template.render_text(data)
+
+def generate_prn_batch(records):
+    """
+    Generate one printer job containing a label for each record.
     
-    # Create a sample PRN template
-    # The format would need to be adjusted for your specific printer model
-    prn_template = f"""
-N
-D11
-B50,20,0,1,2,8,40,B,"{devotee_id}"
-A60,70,0,3,1,1,N,"{devotee_name}"
-A60,100,0,3,1,1,N,"Item: {item}"
-A60,130,0,2,1,1,N,"Date: {date}"
-P1
-"""
+    Args:
+        records (iterable): Label data dicts, as for generate_prn_template
     
-    return prn_template
+    Returns:
+        bytes: The encoded printer job
+    """
+    return bytes(default_label_template.render_batch(records))
 
 def format_label_for_printer(data):
     """
@@ -0,0 +1,96 @@
+"""
+Query plan checks for the hot queries
+
+Each check builds one of the queries the application runs and asserts, with
+SQLite's EXPLAIN QUERY PLAN, that it is answered through the expected index
+rather than a full table scan.
+"""
+
+from datetime import datetime, timedelta
+
+from database import db_session, engine
+from utils.devotee_list import devotee_list_query, active_devotees_query
+from utils.report_generator import daily_counts_query, top_devotees_query
+from utils.rollup import rollup_source
+from utils.visit_history import visit_history_query
+
+def _plan_checks():
+    today = datetime.now().date()
+    week_ago = today - timedelta(days=7)
+    
+    return [
+        (
+            'report daily counts',
+            daily_counts_query(week_ago, today).statement,
+            'sqlite_autoindex_visit_daily_rollup_1'
+        ),
+        (
+            'rollup rebuild since date',
+            rollup_source(week_ago),
+            'ix_visits_visit_date'
+        ),
+        (
+            'devotee visit history',
+            visit_history_query(1, limit=50).statement,
+            'ix_visits_devotee_id_visit_date'
+        ),
+        (
+            'devotee visit history by date',
+            visit_history_query(1, start=week_ago, end=today, limit=50).statement,
+            'ix_visits_devotee_id_visit_date'
+        ),
+        (
+            'devotee list search',
+            devotee_list_query(search='ram', limit=50).statement,
+            'ix_devotees_name_lower'
+        ),
+        (
+            'top devotees',
+            top_devotees_query(10).statement,
+            'ix_devotees_visit_count'
+        ),
+        (
+            'recently active devotees',
+            active_devotees_query(week_ago).statement,
+            'ix_devotees_last_visit_at'
+        )
+    ]
+
+def explain(statement):
+    """
+    Get SQLite's query plan for a statement.
+    
+    Args:
+        statement: A SQLAlchemy select statement
+    
+    Returns:
+        list: The detail column of each EXPLAIN QUERY PLAN row
+    """
+    sql = str(statement.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True}))
+    rows = db_session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + sql).all()
+    return [row[-1] for row in rows]
+
+def check_query_plans():
+    """
+    Run all query plan checks.
+    
+    Returns:
+        list: One dict per check with name, expected index, plan and ok flag
+    
+    Raises:
+        RuntimeError: If the database is not SQLite
+    """
+    if engine.dialect.name != 'sqlite':
+        raise RuntimeError('Query plan checks are only available for SQLite')
+    
+    results = []
+    for name, statement, index_name in _plan_checks():
+        plan = explain(statement)
+        results.append({
+            'name': name,
+            'index': index_name,
+            'plan': plan,
+            'ok': any(index_name in detail for detail in plan)
+        })
+    
+    return results
@@ -0,0 +1,152 @@
+"""
+Result cache for generate_report
+
+Reports over past days never change, only the buckets that contain today
+move as visits come in. Results are cached per report type and parameters
+with a TTL and LRU eviction, and recording a visit drops only the cached
+reports whose date range contains the visit date.
+
+Whole reports are cached, not buckets, so a report whose range reaches
+today is dropped by every check-in and mostly misses while visits come in.
+The cache pays off for reports over past ranges.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from config import Config
+from utils.report_generator import generate_report, generate_dashboard_report, report_date_range, dashboard_version, report_generation, bump_report_generation
+
+class ReportCache:
+    """
+    A bounded, thread-safe LRU cache of report results with a TTL.
+    """
+    
+    def __init__(self, max_entries=128, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+    
+    def get_or_compute(self, key, date_range, compute):
+        """
+        Return the cached value for a key, computing and storing it on a miss.
+        
+        Args:
+            key (tuple): The cache key
+            date_range (tuple): First and last visit date the value depends on,
+                None if it depends on all visits
+            compute (callable): Produces the value on a miss
+        
+        Returns:
+            The cached or freshly computed value
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            generation = self._generation
+        
+        value = compute()
+        
+        with self._lock:
+            # Don't store a value that an invalidation during compute() made stale
+            if generation != self._generation:
+                return value
+            self._entries[key] = (now + self.ttl, date_range, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        
+        return value
+    
+    def invalidate_dates(self, dates):
+        """
+        Drop cached values whose date range contains any of the given dates.
+        
+        Args:
+            dates (iterable): Dates on which visits were recorded
+        """
+        dates = set(dates)
+        with self._lock:
+            stale = [
+                key for key, (_, date_range, _) in self._entries.items()
+                if date_range is None or any(date_range[0] <= day <= date_range[1] for day in dates)
+            ]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+            self._generation += 1
+    
+    def clear(self):
+        """
+        Drop all cached values.
+        """
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._generation += 1
+    
+    def stats(self):
+        """
+        Get the cache size and hit, miss and invalidation counters.
+        """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations
+            }
+
+report_cache = ReportCache(max_entries=Config.REPORT_CACHE_SIZE, ttl=Config.REPORT_CACHE_TTL)
+
+def cached_report(report_type, **params):
+    """
+    Generate a report through the cache, see generate_report.
+    """
+    # Relative reports (e.g. the past 7 days) mean something else tomorrow,
+    # and every report changes with a new report data generation
+    key = (report_type, datetime.now().date(), tuple(sorted(params.items())), report_generation())
+    
+    return report_cache.get_or_compute(
+        key,
+        report_date_range(report_type, **params),
+        lambda: generate_report(report_type, **params)
+    )
+
+def cached_dashboard_report(version=None):
+    """
+    Generate the dashboard report through the cache, see generate_dashboard_report.
+    
+    The report is cached per dashboard_version, so a new devotee or a visit
+    committed by another worker yields a new entry instead of the stale one.
+    
+    Args:
+        version (str): The dashboard_version the caller already looked up
+    """
+    if version is None:
+        version = dashboard_version()
+    return report_cache.get_or_compute(('dashboard', version), None, generate_dashboard_report)
+
+def invalidate_reports():
+    """
+    Drop cached reports in every process, after report data was rewritten.
+    
+    Other server processes have their own caches, a new report data
+    generation makes them compute their reports again.
+    """
+    bump_report_generation()
+    report_cache.clear()
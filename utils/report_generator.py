@@ -2,19 +2,52 @@
 Report generation utilities
 """
 
-from datetime import datetime, timedelta
-from sqlalchemy import func, cast, Date
-import calendar
+import hashlib
+from collections import defaultdict
+from functools import wraps
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, case, insert, select, update
 
 from database import db_session
-from models import Visit, Devotee, Item
+from models import Visit, Devotee, SyncState, VisitDailyRollup
+from utils.analytics import generate_heatmap_report, generate_retention_report, generate_item_distribution_report
+from utils.devotee_list import count_devotees, count_active_devotees
+from utils.item_catalog import item_catalog
 
-def generate_report(report_type):
+# Default label formats for each time-series granularity
+LABEL_FORMATS = {
+    'day': '%b %d',
+    'week': '%b %d',
+    'month': '%b %Y',
+    'year': '%Y'
+}
+
+# sync_state row counting rewrites of report data, see bump_report_generation
+REPORT_GENERATION_ID = 2
+
+# Upper bound on the number of buckets a single time-series report may return
+MAX_BUCKETS = 1000
+
+def _dates_in_range(function):
+    # Date arithmetic near date.min or date.max overflows, report it like other bad parameters
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        try:
+            return function(*args, **kwargs)
+        except OverflowError:
+            raise ValueError('Dates must be between 0001-01-01 and 9999-12-31')
+    return wrapper
+
+@_dates_in_range
+def generate_report(report_type, **params):
     """
     Generate a report based on the specified type.
     
     Args:
-        report_type (str): The type of report to generate (daily, monthly, yearly, devotees)
+        report_type (str): The type of report to generate (daily, monthly, yearly, devotees,
+            items, timeseries, or with NumPy installed heatmap, retention, item_distribution)
+        **params: Extra parameters for the timeseries, heatmap and item_distribution
+            reports (granularity, start, end) and the retention report (months)
     
     Returns:
         dict: A dictionary containing the report data with labels and values
@@ -29,6 +62,29 @@ def generate_report(report_type):
         return generate_devotees_report()
     elif report_type == 'items':
         return generate_items_report()
+    elif report_type == 'timeseries':
+        return generate_timeseries_report(
+            granularity=params.get('granularity', 'day'),
+            start=params.get('start'),
+            end=params.get('end')
+        )
+    elif report_type == 'heatmap':
+        start_date, end_date = report_date_range('heatmap', **params)
+        return generate_heatmap_report(start_date, end_date)
+    elif report_type == 'retention':
+        months = int(params.get('months', 12))
+        if not 1 <= months <= 120:
+            raise ValueError('months must be between 1 and 120')
+        return generate_retention_report(months)
+    elif report_type == 'item_distribution':
+        granularity = params.get('granularity', 'month')
+        if granularity not in LABEL_FORMATS:
+            raise ValueError(f'Unknown granularity: {granularity}')
+        start_date, range_end = report_date_range('item_distribution', **params)
+        buckets = list(iter_buckets(granularity, start_date, range_end))
+        if len(buckets) > MAX_BUCKETS:
+            raise ValueError(f'Range too large: more than {MAX_BUCKETS} buckets')
+        return generate_item_distribution_report(buckets, range_end, LABEL_FORMATS[granularity])
     else:
         # Default to an empty report
         return {
@@ -36,129 +92,372 @@ def generate_report(report_type):
             'values': []
         }
 
-def generate_daily_report():
+@_dates_in_range
+def report_date_range(report_type, **params):
+    """
+    Get the range of visit dates a report is computed from.
+    
+    Args:
+        report_type (str): The type of report
+        **params: The report parameters, as for generate_report
+    
+    Returns:
+        tuple: The first and last date (inclusive), or None when the report
+            covers all visits
+    """
+    today = datetime.now().date()
+    
+    if report_type == 'daily':
+        return today - timedelta(days=6), today
+    elif report_type == 'monthly':
+        start_date = today.replace(day=1)
+        for _ in range(11):
+            start_date = (start_date - timedelta(days=1)).replace(day=1)
+        return start_date, today
+    elif report_type == 'yearly':
+        return date(today.year - 4, 1, 1), today
+    elif report_type == 'timeseries':
+        granularity = params.get('granularity', 'day')
+        end_date = _parse_date(params['end']) if params.get('end') else today
+        start_date = _parse_date(params['start']) if params.get('start') else end_date - timedelta(days=29)
+        last_bucket = bucket_start(end_date, granularity)
+        return bucket_start(start_date, granularity), next_bucket(last_bucket, granularity) - timedelta(days=1)
+    elif report_type == 'heatmap':
+        end_date = _parse_date(params['end']) if params.get('end') else today
+        start_date = _parse_date(params['start']) if params.get('start') else end_date - timedelta(days=89)
+        if start_date > end_date:
+            raise ValueError('start must not be after end')
+        return start_date, end_date
+    elif report_type == 'item_distribution':
+        granularity = params.get('granularity', 'month')
+        end_date = _parse_date(params['end']) if params.get('end') else today
+        start_date = _parse_date(params['start']) if params.get('start') else date(end_date.year, 1, 1)
+        if start_date > end_date:
+            raise ValueError('start must not be after end')
+        last_bucket = bucket_start(end_date, granularity)
+        return bucket_start(start_date, granularity), next_bucket(last_bucket, granularity) - timedelta(days=1)
+    
+    return None
+
+def generate_daily_report(daily_counts=None):
     """
     Generate a report of daily visits for the past 7 days.
     
+    Args:
+        daily_counts (dict): Visit counts by date covering the range, queried when omitted
+    
     Returns:
         dict: A dictionary with labels (dates) and values (visit counts)
     """
     end_date = datetime.now().date()
     start_date = end_date - timedelta(days=6)
     
-    labels = []
-    values = []
+    return generate_time_series('day', start_date, end_date, daily_counts=daily_counts)
+
+def generate_monthly_report(daily_counts=None):
+    """
+    Generate a report of monthly visits for the past 12 months.
     
-    current_date = start_date
-    while current_date <= end_date:
-        # Count visits for the current date
-        count = Visit.query.filter(
-            cast(Visit.visit_date, Date) == current_date
-        ).count()
-        
-        # Format the date for display
-        formatted_date = current_date.strftime('%b %d')
-        
-        labels.append(formatted_date)
-        values.append(count)
-        
-        # Move to the next day
-        current_date += timedelta(days=1)
+    Args:
+        daily_counts (dict): Visit counts by date covering the range, queried when omitted
+    
+    Returns:
+        dict: A dictionary with labels (months) and values (visit counts)
+    """
+    today = datetime.now().date()
+    
+    # Step back 11 months from the first day of the current month
+    start_date = today.replace(day=1)
+    for _ in range(11):
+        start_date = (start_date - timedelta(days=1)).replace(day=1)
+    
+    return generate_time_series('month', start_date, today, daily_counts=daily_counts)
+
+def generate_yearly_report(daily_counts=None):
+    """
+    Generate a report of yearly visits for the past 5 years.
+    
+    Args:
+        daily_counts (dict): Visit counts by date covering the range, queried when omitted
+    
+    Returns:
+        dict: A dictionary with labels (years) and values (visit counts)
+    """
+    today = datetime.now().date()
+    start_date = date(today.year - 4, 1, 1)
+    
+    return generate_time_series('year', start_date, today, daily_counts=daily_counts)
+
+def generate_timeseries_report(granularity='day', start=None, end=None):
+    """
+    Generate a report of visits over an arbitrary date range.
+    
+    Args:
+        granularity (str): One of day, week, month or year
+        start (str): First date of the range (YYYY-MM-DD), defaults to 30 days ago
+        end (str): Last date of the range (YYYY-MM-DD), defaults to today
+    
+    Returns:
+        dict: A dictionary with labels (bucket names) and values (visit counts)
+    """
+    end_date = _parse_date(end) if end else datetime.now().date()
+    start_date = _parse_date(start) if start else end_date - timedelta(days=29)
+    
+    if start_date > end_date:
+        raise ValueError('start must not be after end')
+    
+    return generate_time_series(granularity, start_date, end_date)
+
+def generate_time_series(granularity, start_date, end_date, label_format=None, daily_counts=None):
+    """
+    Count visits per bucket between two dates with a single grouped query.
+    
+    The range is widened to whole buckets, daily counts are read from the
+    visit_daily_rollup table in one GROUP BY over its primary key, and folded
+    into buckets in Python. Buckets without visits are filled with zero.
+    
+    Args:
+        granularity (str): One of day, week, month or year
+        start_date (date): First date of the range
+        end_date (date): Last date of the range
+        label_format (str): strftime format for the labels, defaults per granularity
+        daily_counts (dict): Visit counts by date covering the range, queried when omitted
+    
+    Returns:
+        dict: A dictionary with labels (bucket names) and values (visit counts)
+    """
+    if granularity not in LABEL_FORMATS:
+        raise ValueError(f'Unknown granularity: {granularity}')
+    
+    buckets = list(iter_buckets(granularity, start_date, end_date))
+    if len(buckets) > MAX_BUCKETS:
+        raise ValueError(f'Range too large: more than {MAX_BUCKETS} buckets')
+    
+    range_end = next_bucket(buckets[-1], granularity) - timedelta(days=1)
+    
+    if daily_counts is None:
+        daily_counts = count_visits_by_day(buckets[0], range_end)
+    
+    counts = defaultdict(int)
+    for day, count in daily_counts.items():
+        if buckets[0] <= day <= range_end:
+            counts[bucket_start(day, granularity)] += count
+    
+    label_format = label_format or LABEL_FORMATS[granularity]
     
     return {
-        'labels': labels,
-        'values': values
+        'labels': [bucket.strftime(label_format) for bucket in buckets],
+        'values': [counts.get(bucket, 0) for bucket in buckets]
     }
 
-def generate_monthly_report():
+def generate_dashboard_report():
     """
-    Generate a report of monthly visits for the past 12 months.
+    Generate the visit totals and all dashboard chart series in one go.
+    
+    The daily, monthly and yearly series are folded from a single rollup
+    query covering the past five years.
     
     Returns:
-        dict: A dictionary with labels (months) and values (visit counts)
+        dict: A dictionary with stats (visit and devotee totals) and reports
+            (labels and values for each chart)
     """
-    today = datetime.now()
-    labels = []
-    values = []
-    
-    # Generate data for the past 12 months
-    for i in range(11, -1, -1):
-        # Calculate the month
-        month = (today.month - i) % 12
-        if month == 0:
-            month = 12
-        year = today.year if month <= today.month else today.year - 1
-        
-        # Get the first and last day of the month
-        _, last_day = calendar.monthrange(year, month)
-        first_date = datetime(year, month, 1).date()
-        last_date = datetime(year, month, last_day).date()
-        
-        # Count visits for the month
-        count = Visit.query.filter(
-            cast(Visit.visit_date, Date) >= first_date,
-            cast(Visit.visit_date, Date) <= last_date
-        ).count()
-        
-        # Format the month for display
-        month_name = datetime(year, month, 1).strftime('%b %Y')
-        
-        labels.append(month_name)
-        values.append(count)
+    today = datetime.now().date()
+    daily_counts = count_visits_by_day(date(today.year - 4, 1, 1), today)
+    totals = generate_visit_totals()
     
     return {
-        'labels': labels,
-        'values': values
+        'stats': {
+            'total_visits': totals['total'],
+            'daily_visits': totals['daily'],
+            'monthly_visits': totals['monthly'],
+            'yearly_visits': totals['yearly'],
+            'total_devotees': count_devotees(),
+            'active_devotees': count_active_devotees(today - timedelta(days=29))
+        },
+        'reports': {
+            'daily': generate_daily_report(daily_counts),
+            'monthly': generate_monthly_report(daily_counts),
+            'yearly': generate_yearly_report(daily_counts),
+            'devotees': generate_devotees_report(totals['total']),
+            'items': generate_items_report()
+        }
     }
 
-def generate_yearly_report():
+def dashboard_version():
     """
-    Generate a report of yearly visits for the past 5 years.
+    Get a fingerprint that changes whenever the dashboard data can change.
+    
+    Visits and devotees are only ever added, so their highest ids together
+    with the current date identify the state of every dashboard figure,
+    apart from maintenance commands that rewrite report data, which bump
+    the report data generation.
     
     Returns:
-        dict: A dictionary with labels (years) and values (visit counts)
+        str: A short hex digest suitable as an ETag
     """
-    current_year = datetime.now().year
-    labels = []
-    values = []
+    max_visit_id, max_devotee_id, generation = db_session.query(
+        select(func.max(Visit.id)).scalar_subquery(),
+        select(func.max(Devotee.id)).scalar_subquery(),
+        _report_generation_query()
+    ).one()
+    
+    state = f'{datetime.now().date()}:{max_visit_id}:{max_devotee_id}:{generation or 0}'
+    return hashlib.sha1(state.encode()).hexdigest()[:16]
+
+def _report_generation_query():
+    sync_state = SyncState.__table__
+    return select(sync_state.c.version).where(sync_state.c.id == REPORT_GENERATION_ID).scalar_subquery()
+
+def report_generation():
+    """
+    Get the report data generation, shared by all processes through the database.
+    
+    Returns:
+        int: The generation, 0 until report data is first rewritten
+    """
+    return db_session.query(_report_generation_query()).scalar() or 0
+
+def bump_report_generation():
+    """
+    Start a new report data generation and commit it.
     
-    # Generate data for the past 5 years
-    for year in range(current_year - 4, current_year + 1):
-        first_date = datetime(year, 1, 1).date()
-        last_date = datetime(year, 12, 31).date()
-        
-        # Count visits for the year
-        count = Visit.query.filter(
-            cast(Visit.visit_date, Date) >= first_date,
-            cast(Visit.visit_date, Date) <= last_date
-        ).count()
-        
-        labels.append(str(year))
-        values.append(count)
+    Every process then stops serving reports cached before, e.g. after the
+    rollup was rebuilt or visits were archived by a CLI command.
+    """
+    sync_state = SyncState.__table__
+    result = db_session.execute(
+        update(sync_state).where(sync_state.c.id == REPORT_GENERATION_ID).values(version=sync_state.c.version + 1)
+    )
+    if result.rowcount == 0:
+        db_session.execute(insert(sync_state).values(id=REPORT_GENERATION_ID, version=1))
+    db_session.commit()
+
+def count_visits_by_day(start_date, end_date):
+    """
+    Count visits per calendar day between two dates (inclusive).
+    
+    Args:
+        start_date (date): First day to count
+        end_date (date): Last day to count
+    
+    Returns:
+        dict: Visit counts keyed by date, days without visits are omitted
+    """
+    result = daily_counts_query(start_date, end_date).all()
+    
+    return {_parse_date(day): int(count) for day, count in result}
+
+def daily_counts_query(start_date, end_date):
+    """
+    Build the query summing the rollup per day between two dates (inclusive).
+    """
+    return db_session.query(
+        VisitDailyRollup.day,
+        func.sum(VisitDailyRollup.visit_count)
+    ).filter(
+        VisitDailyRollup.day >= start_date,
+        VisitDailyRollup.day <= end_date
+    ).group_by(
+        VisitDailyRollup.day
+    )
+
+def generate_visit_totals():
+    """
+    Count total visits and the visits of today, this month and this year.
+    
+    Returns:
+        dict: A dictionary with total, daily, monthly and yearly visit counts
+    """
+    today = datetime.now().date()
+    month_start = today.replace(day=1)
+    year_start = today.replace(month=1, day=1)
+    
+    def visits_since(first_day):
+        return func.sum(case(
+            (VisitDailyRollup.day >= first_day, VisitDailyRollup.visit_count),
+            else_=0
+        ))
+    
+    total, daily, monthly, yearly = db_session.query(
+        func.sum(VisitDailyRollup.visit_count),
+        visits_since(today),
+        visits_since(month_start),
+        visits_since(year_start)
+    ).one()
     
     return {
-        'labels': labels,
-        'values': values
+        'total': int(total or 0),
+        'daily': int(daily or 0),
+        'monthly': int(monthly or 0),
+        'yearly': int(yearly or 0)
     }
 
-def generate_devotees_report():
+def bucket_start(day, granularity):
+    """
+    Get the first day of the bucket that contains a date.
+    
+    Args:
+        day (date): The date to place in a bucket
+        granularity (str): One of day, week, month or year
+    
+    Returns:
+        date: The first day of the bucket (weeks start on Monday)
+    """
+    if granularity == 'day':
+        return day
+    elif granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    elif granularity == 'month':
+        return day.replace(day=1)
+    elif granularity == 'year':
+        return day.replace(month=1, day=1)
+    raise ValueError(f'Unknown granularity: {granularity}')
+
+def next_bucket(start, granularity):
+    """
+    Get the first day of the bucket following the one starting at ``start``.
+    """
+    if granularity == 'day':
+        return start + timedelta(days=1)
+    elif granularity == 'week':
+        return start + timedelta(days=7)
+    elif granularity == 'month':
+        if start.month == 12:
+            return date(start.year + 1, 1, 1)
+        return date(start.year, start.month + 1, 1)
+    elif granularity == 'year':
+        return date(start.year + 1, 1, 1)
+    raise ValueError(f'Unknown granularity: {granularity}')
+
+def iter_buckets(granularity, start_date, end_date):
+    """
+    Yield the first day of every bucket overlapping the given date range.
+    """
+    current = bucket_start(start_date, granularity)
+    while current <= end_date:
+        yield current
+        current = next_bucket(current, granularity)
+
+def _parse_date(value):
+    # SQLite returns date() results as ISO strings, other backends as dates
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(value)
+
+def generate_devotees_report(total_visits=None):
     """
     Generate a report of the top devotees by visit count.
     
+    Args:
+        total_visits (int): Total number of visits, queried when omitted
+    
     Returns:
         dict: A dictionary with labels (devotee names) and values (visit counts)
     """
-    # Get the top 10 devotees by visit count
-    result = db_session.query(
-        Devotee.name,
-        func.count(Visit.id).label('visit_count')
-    ).join(
-        Visit, Visit.devotee_id == Devotee.id
-    ).group_by(
-        Devotee.id
-    ).order_by(
-        func.count(Visit.id).desc()
-    ).limit(10).all()
+    # Get the top 10 devotees by visit count, read from ix_devotees_visit_count
+    result = top_devotees_query(10).all()
     
     labels = []
     values = []
@@ -170,13 +469,28 @@ def generate_devotees_report():
     # If there are fewer than 10 devotees, add "Others" category
     if len(result) < 10:
         labels.append("Others")
-        values.append(Visit.query.count() - sum(values))
+        if total_visits is None:
+            total_visits = generate_visit_totals()['total']
+        values.append(total_visits - sum(values))
     
     return {
         'labels': labels,
         'values': values
     }
 
+def top_devotees_query(limit):
+    """
+    Build the query for the devotees with the most visits.
+    """
+    return db_session.query(
+        Devotee.name,
+        Devotee.visit_count
+    ).filter(
+        Devotee.visit_count > 0
+    ).order_by(
+        Devotee.visit_count.desc()
+    ).limit(limit)
+
 def generate_items_report():
     """
     Generate a report of item distribution.
@@ -185,22 +499,21 @@ def generate_items_report():
         dict: A dictionary with labels (item names) and values (selection counts)
     """
     # Count how many times each item has been selected
+    total_selected = func.sum(VisitDailyRollup.visit_count)
     result = db_session.query(
-        Item.name,
-        func.count(Visit.id).label('selection_count')
-    ).join(
-        Visit, Visit.item_id == Item.id
+        VisitDailyRollup.item_id,
+        total_selected.label('selection_count')
     ).group_by(
-        Item.id
+        VisitDailyRollup.item_id
     ).order_by(
-        func.count(Visit.id).desc()
+        total_selected.desc()
     ).all()
     
     labels = []
     values = []
     
-    for item_name, selection_count in result:
-        labels.append(item_name)
+    for item_id, selection_count in result:
+        labels.append(item_catalog.name(item_id))
         values.append(selection_count)
     
     return {
@@ -0,0 +1,133 @@
+"""
+Maintenance of the visit_daily_rollup table
+
+The rollup holds one row per (day, item) with the number of visits recorded
+for it. It is updated in the same transaction as every Visit insert so that
+reports can sum a handful of rows per day instead of scanning visits.
+"""
+
+from collections import Counter
+from datetime import datetime, time
+from sqlalchemy import func, insert, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database import db_session, engine
+from models import Visit, VisitDailyRollup
+from utils.archive import archive_cutoff
+
+rollup_table = VisitDailyRollup.__table__
+
+def _upsert_statement():
+    # INSERT ... ON CONFLICT adding to the existing count, on databases with upserts
+    if engine.dialect.name == 'sqlite':
+        statement = sqlite_insert(rollup_table)
+    elif engine.dialect.name == 'postgresql':
+        statement = postgresql_insert(rollup_table)
+    else:
+        return None
+    return statement.on_conflict_do_update(
+        index_elements=[rollup_table.c.day, rollup_table.c.item_id],
+        set_={'visit_count': rollup_table.c.visit_count + statement.excluded.visit_count}
+    )
+
+def record_visits(visits):
+    """
+    Add visits to the daily rollup within the current transaction.
+    
+    The caller is responsible for committing, together with the Visit rows.
+    Rows are upserted, so two transactions creating the same (day, item)
+    row don't collide on the primary key.
+    
+    Args:
+        visits (iterable): (visit_date, item_id) pairs for the new visits
+    """
+    counts = Counter((visit_date.date(), item_id) for visit_date, item_id in visits)
+    if not counts:
+        return
+    
+    # Key order, so concurrent transactions lock rollup rows in the same order
+    rows = [
+        {'day': day, 'item_id': item_id, 'visit_count': count}
+        for (day, item_id), count in sorted(counts.items())
+    ]
+    upsert = _upsert_statement()
+    if upsert is not None:
+        db_session.execute(upsert, rows)
+        return
+    
+    for row in rows:
+        result = db_session.execute(
+            rollup_table.update().where(
+                rollup_table.c.day == row['day'],
+                rollup_table.c.item_id == row['item_id']
+            ).values(
+                visit_count=rollup_table.c.visit_count + row['visit_count']
+            )
+        )
+        if result.rowcount == 0:
+            db_session.execute(insert(rollup_table).values(**row))
+
+def rebuild_rollup(since=None):
+    """
+    Recompute the rollup from the visits table.
+    
+    Days before the archive cutoff are left as they are, their visits are
+    no longer in the visits table.
+    
+    Args:
+        since (date): Only rebuild days on or after this date, defaults to all days
+    
+    Returns:
+        int: The number of rollup rows written
+    """
+    cutoff = archive_cutoff()
+    if cutoff is not None and (since is None or since < cutoff):
+        since = cutoff
+    
+    source = rollup_source(since)
+    
+    delete = rollup_table.delete()
+    if since is not None:
+        delete = delete.where(rollup_table.c.day >= since)
+    
+    db_session.execute(delete)
+    result = db_session.execute(
+        insert(rollup_table).from_select(['day', 'item_id', 'visit_count'], source)
+    )
+    db_session.commit()
+    
+    return result.rowcount
+
+def rollup_source(since=None):
+    """
+    Build the SELECT aggregating visits into (day, item_id, visit_count) rows.
+    
+    Args:
+        since (date): Only aggregate visits on or after this date
+    """
+    visit_day = func.date(Visit.visit_date)
+    source = select(
+        visit_day,
+        Visit.item_id,
+        func.count(Visit.id)
+    ).group_by(
+        visit_day,
+        Visit.item_id
+    )
+    
+    if since is not None:
+        source = source.where(Visit.visit_date >= datetime.combine(since, time.min))
+    
+    return source
+
+def ensure_rollup():
+    """
+    Backfill the rollup when it is empty but visits already exist,
+    e.g. the first start after upgrading an existing database.
+    """
+    has_rollup = db_session.query(rollup_table.c.day).limit(1).first() is not None
+    has_visits = db_session.query(Visit.id).limit(1).first() is not None
+    
+    if has_visits and not has_rollup:
+        rebuild_rollup()
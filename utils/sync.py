@@ -0,0 +1,124 @@
+"""
+Delta sync of the devotee directory and item list for offline kiosks
+
+Every transaction that adds or changes devotees or items takes the next
+value of a single change counter (the sync_state row) and stamps it on the
+rows as their sync_version. Incrementing the counter locks its row until
+commit, so versions become visible in increasing order and a client that
+has seen everything up to (version, id) only ever needs the rows after it.
+
+Clients keep an opaque cursor, "<devotee version>.<devotee id>.<item
+version>", and ask for the changes after it page by page.
+"""
+
+from sqlalchemy import event, select, tuple_, update
+from sqlalchemy.orm import Session
+
+from database import db_session
+from models import Devotee, Item, SyncState
+
+# Columns sent for every changed devotee and item, in this order
+DEVOTEE_FIELDS = ('id', 'devotee_id', 'name', 'phone')
+ITEM_FIELDS = ('id', 'name')
+
+def next_sync_version(session):
+    """
+    Take the next change counter value within the session's transaction.
+    
+    Args:
+        session (Session): The session making the changes
+    
+    Returns:
+        int: The sync_version for every row changed in this transaction
+    """
+    sync_state = SyncState.__table__
+    session.execute(update(sync_state).where(sync_state.c.id == 1).values(version=sync_state.c.version + 1))
+    return session.execute(select(sync_state.c.version).where(sync_state.c.id == 1)).scalar_one()
+
+@event.listens_for(Session, 'before_flush')
+def _stamp_sync_version(session, flush_context, instances):
+    changed = [
+        obj for obj in session.new | session.dirty
+        if isinstance(obj, (Devotee, Item)) and (obj in session.new or session.is_modified(obj))
+    ]
+    if changed:
+        # One version per transaction is enough, (version, id) orders the rows
+        version = session.info.get('sync_version')
+        if version is None:
+            version = session.info['sync_version'] = next_sync_version(session)
+        for obj in changed:
+            obj.sync_version = version
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _forget_sync_version(session):
+    session.info.pop('sync_version', None)
+
+def parse_cursor(cursor):
+    """
+    Parse a sync cursor.
+    
+    Args:
+        cursor (str): A cursor from a previous page, or None for a full sync
+    
+    Returns:
+        tuple: (devotee version, devotee id, item version)
+    
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    if not cursor:
+        return -1, 0, -1
+    try:
+        devotee_version, devotee_pk, item_version = (int(part) for part in cursor.split('.'))
+    except ValueError:
+        raise ValueError('Invalid sync cursor')
+    return devotee_version, devotee_pk, item_version
+
+def list_changes(cursor=None, limit=1000):
+    """
+    Get one page of devotee and item changes after a cursor.
+    
+    Rows are sent as lists of values in the order of their fields. Items
+    are few, so all changed items come with the first page.
+    
+    Args:
+        cursor (str): The cursor returned with the previous page, None for
+            a full sync
+        limit (int): Maximum number of devotees in the page
+    
+    Returns:
+        dict: devotees and items (each with fields and rows), the cursor
+            for the next page and whether more changes are waiting (has_more)
+    """
+    devotee_version, devotee_pk, item_version = parse_cursor(cursor)
+    
+    devotees = db_session.query(
+        Devotee.sync_version, *(getattr(Devotee, field) for field in DEVOTEE_FIELDS)
+    ).filter(
+        tuple_(Devotee.sync_version, Devotee.id) > (devotee_version, devotee_pk)
+    ).order_by(
+        Devotee.sync_version, Devotee.id
+    ).limit(limit + 1).all()
+    
+    has_more = len(devotees) > limit
+    devotees = devotees[:limit]
+    if devotees:
+        devotee_version, devotee_pk = devotees[-1][0], devotees[-1][1]
+    
+    items = db_session.query(
+        Item.sync_version, *(getattr(Item, field) for field in ITEM_FIELDS)
+    ).filter(
+        Item.sync_version > item_version
+    ).order_by(
+        Item.sync_version, Item.id
+    ).all()
+    if items:
+        item_version = items[-1][0]
+    
+    return {
+        'devotees': {'fields': DEVOTEE_FIELDS, 'rows': [list(row[1:]) for row in devotees]},
+        'items': {'fields': ITEM_FIELDS, 'rows': [list(row[1:]) for row in items]},
+        'cursor': f'{devotee_version}.{devotee_pk}.{item_version}',
+        'has_more': has_more
+    }
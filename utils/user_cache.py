@@ -0,0 +1,108 @@
+"""
+In-process cache of the activation state and logged-in users
+
+Every page checks whether the app has been activated (an admin exists) and
+Flask-Login loads the current user on every authenticated request. Once an
+admin exists the app stays activated, so that state is cached for good,
+and users are kept for a short TTL as detached objects. Committed changes
+to a User drop its cache entry; other processes pick them up after the TTL.
+"""
+
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from config import Config
+from database import db_session
+from models import User
+
+class UserCache:
+    """
+    Users by primary key with a TTL, plus the cached activation state.
+    """
+    
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._users = {}
+        self._generation = 0
+        self._activated = False
+    
+    def is_activated(self):
+        """
+        Check whether an admin account exists, querying only until one does.
+        """
+        if self._activated:
+            return True
+        activated = db_session.query(User.id).filter_by(is_admin=True).first() is not None
+        if activated:
+            self._activated = True
+        return activated
+    
+    def get(self, user_id):
+        """
+        Get a user by primary key, loading it on a miss or after the TTL.
+        
+        Returns:
+            User: A detached user, or None if there is no such user
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._users.get(user_id)
+            generation = self._generation
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        
+        user = db_session.get(User, user_id)
+        if user is None:
+            return None
+        # Detach it so it outlives this request's session
+        db_session.expunge(user)
+        
+        with self._lock:
+            # Don't keep a user that was changed while it was loading
+            if generation == self._generation:
+                self._users[user_id] = (now + self.ttl, user)
+        return user
+    
+    def invalidate(self, user_ids=None, deleted=False):
+        """
+        Drop cached users, all of them if no ids are given.
+        
+        Args:
+            user_ids (iterable): Primary keys of the changed users
+            deleted (bool): Whether users were deleted, which may deactivate the app
+        """
+        with self._lock:
+            if user_ids is None:
+                self._users.clear()
+            else:
+                for user_id in user_ids:
+                    self._users.pop(user_id, None)
+            self._generation += 1
+            if deleted:
+                self._activated = False
+
+user_cache = UserCache(ttl=Config.USER_CACHE_TTL)
+
+@event.listens_for(Session, 'after_flush')
+def _track_user_changes(session, flush_context):
+    changed = session.info.setdefault('changed_user_ids', set())
+    for obj in session.dirty | session.deleted:
+        if isinstance(obj, User):
+            changed.add(obj.id)
+    if any(isinstance(obj, User) for obj in session.deleted):
+        session.info['users_deleted'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    changed = session.info.pop('changed_user_ids', None)
+    deleted = session.info.pop('users_deleted', False)
+    if changed or deleted:
+        user_cache.invalidate(changed, deleted)
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_user_changes(session):
+    session.info.pop('changed_user_ids', None)
+    session.info.pop('users_deleted', None)
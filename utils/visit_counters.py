@@ -0,0 +1,111 @@
+"""
+Maintenance of the per-devotee visit counters
+
+Devotee.visit_count and Devotee.last_visit_at are updated in the same
+transaction as every Visit insert, so the top devotees and when a devotee
+was last seen are index reads instead of aggregations over visits.
+Archiving leaves them alone, they keep counting archived visits.
+"""
+
+from sqlalchemy import bindparam, case, func, or_, select, update
+
+from database import db_session
+from models import ArchivedVisitSummary, Devotee, Visit
+
+devotees_table = Devotee.__table__
+
+def record_devotee_visits(visits):
+    """
+    Add visits to the devotees' counters within the current transaction.
+    
+    The caller is responsible for committing, together with the Visit rows.
+    
+    Args:
+        visits (iterable): (devotee_pk, visit_date) pairs for the new visits
+    """
+    counters = {}
+    for devotee_pk, visit_date in visits:
+        count, last_visit = counters.get(devotee_pk, (0, visit_date))
+        counters[devotee_pk] = (count + 1, max(last_visit, visit_date))
+    if not counters:
+        return
+    
+    last_visit = bindparam('last_visit')
+    db_session.execute(
+        update(devotees_table).where(
+            devotees_table.c.id == bindparam('devotee_pk')
+        ).values(
+            visit_count=devotees_table.c.visit_count + bindparam('added'),
+            last_visit_at=case(
+                (or_(devotees_table.c.last_visit_at.is_(None), devotees_table.c.last_visit_at < last_visit), last_visit),
+                else_=devotees_table.c.last_visit_at
+            )
+        ),
+        # Primary key order, so concurrent check-ins lock devotees in the same order
+        [
+            {'devotee_pk': devotee_pk, 'added': count, 'last_visit': last}
+            for devotee_pk, (count, last) in sorted(counters.items())
+        ]
+    )
+
+def counter_values():
+    """
+    Build the expressions computing both counters of a devotee from scratch.
+    
+    Returns:
+        tuple: visit_count and last_visit_at, correlated to the devotees table
+    """
+    visits = Visit.__table__
+    summary = ArchivedVisitSummary.__table__
+    
+    hot_count = select(func.count(visits.c.id)).where(visits.c.devotee_id == devotees_table.c.id).scalar_subquery()
+    hot_last = select(func.max(visits.c.visit_date)).where(visits.c.devotee_id == devotees_table.c.id).scalar_subquery()
+    archived_count = select(summary.c.visit_count).where(summary.c.devotee_id == devotees_table.c.id).scalar_subquery()
+    archived_last = select(summary.c.last_visit).where(summary.c.devotee_id == devotees_table.c.id).scalar_subquery()
+    
+    visit_count = hot_count + func.coalesce(archived_count, 0)
+    last_visit_at = case((archived_last > hot_last, archived_last), else_=func.coalesce(hot_last, archived_last))
+    return visit_count, last_visit_at
+
+def reconcile_statement(first_pk=None, last_pk=None):
+    """
+    Build the UPDATE correcting the counters of devotees where they are off.
+    
+    Args:
+        first_pk (int): Only devotees with this primary key or higher
+        last_pk (int): Only devotees with this primary key or lower
+    """
+    visit_count, last_visit_at = counter_values()
+    statement = update(devotees_table).where(or_(
+        devotees_table.c.visit_count != visit_count,
+        devotees_table.c.last_visit_at.is_distinct_from(last_visit_at)
+    )).values(
+        visit_count=visit_count,
+        last_visit_at=last_visit_at
+    )
+    if first_pk is not None:
+        statement = statement.where(devotees_table.c.id >= first_pk)
+    if last_pk is not None:
+        statement = statement.where(devotees_table.c.id <= last_pk)
+    return statement
+
+def reconcile_visit_counters(chunk_size=1000):
+    """
+    Recompute the counters from the visits table and the archive summary.
+    
+    Devotees are corrected in primary key ranges, each in its own short
+    transaction, so check-ins can go on in between.
+    
+    Args:
+        chunk_size (int): Number of devotees checked per transaction
+    
+    Returns:
+        int: The number of devotees whose counters were corrected
+    """
+    max_pk = db_session.query(func.max(Devotee.id)).scalar() or 0
+    corrected = 0
+    for first_pk in range(1, max_pk + 1, chunk_size):
+        result = db_session.execute(reconcile_statement(first_pk, first_pk + chunk_size - 1))
+        db_session.commit()
+        corrected += result.rowcount
+    return corrected
@@ -0,0 +1,121 @@
+"""
+Queries for a devotee's visit history
+"""
+
+from datetime import datetime, time, timedelta
+from sqlalchemy import tuple_
+
+from database import db_session
+from models import Visit
+from utils.archive import archived_visit_tables
+
+def visit_history_query(devotee_pk, after=None, start=None, end=None, limit=None, table=None):
+    """
+    Build the query for one page of a devotee's visits.
+    
+    Visits are ordered by (visit_date, id), which is the order of the
+    ix_visits_devotee_id_visit_date index, so a page is a range read on the
+    index no matter how long the history is.
+    
+    Args:
+        devotee_pk (int): Primary key of the devotee
+        after (tuple): Only return visits after this (visit_date, id) cursor,
+            visit_date may be None to only compare ids
+        start (date): Only return visits on or after this date
+        end (date): Only return visits on or before this date
+        limit (int): Maximum number of visits to return
+        table (Table): Visits table to read, defaults to visits (archives
+            have the same columns)
+    
+    Returns:
+        Query: A query yielding (id, visit_date, item_id) rows
+    """
+    table = Visit.__table__ if table is None else table
+    query = db_session.query(
+        table.c.id, table.c.visit_date, table.c.item_id
+    ).filter(
+        table.c.devotee_id == devotee_pk
+    ).order_by(
+        table.c.visit_date, table.c.id
+    )
+    
+    if after is not None:
+        cursor_date, cursor_id = after
+        if cursor_date is None:
+            query = query.filter(table.c.id > cursor_id)
+        else:
+            query = query.filter(tuple_(table.c.visit_date, table.c.id) > (cursor_date, cursor_id))
+    if start is not None:
+        query = query.filter(table.c.visit_date >= datetime.combine(start, time.min))
+    if end is not None:
+        query = query.filter(table.c.visit_date < datetime.combine(end + timedelta(days=1), time.min))
+    if limit is not None:
+        query = query.limit(limit)
+    
+    return query
+
+def history_cursor(devotee_pk, after):
+    """
+    Look up the (visit_date, id) cursor of a visit id from a previous page.
+    
+    Args:
+        devotee_pk (int): Primary key of the devotee
+        after (int): Id of the last visit of the previous page
+    
+    Returns:
+        tuple: (visit_date, id), visit_date is None if the devotee has no
+            visit with this id
+    """
+    cursor_date = db_session.query(Visit.visit_date).filter(
+        Visit.id == after,
+        Visit.devotee_id == devotee_pk
+    ).scalar()
+    if cursor_date is None:
+        for table, archived in archived_visit_tables():
+            cursor_date = db_session.query(table.c.visit_date).filter(
+                table.c.id == after,
+                table.c.devotee_id == devotee_pk,
+                archived
+            ).scalar()
+            if cursor_date is not None:
+                break
+    return cursor_date, after
+
+def iter_visit_history(devotee_pk, after=None, start=None, end=None, limit=None, batch_size=500):
+    """
+    Iterate over one page of a devotee's visits, archived ones included.
+    
+    Archived visits all predate the visits table, so the archives a page
+    needs are read oldest first, and then the visits table. Archives are
+    only attached when the page starts before the archive cutoff.
+    
+    Args:
+        devotee_pk (int): Primary key of the devotee
+        after (int): Only return visits after the visit with this id
+        start (date): Only return visits on or after this date
+        end (date): Only return visits on or before this date
+        limit (int): Maximum number of visits to return
+        batch_size (int): Rows fetched per round trip
+    
+    Yields:
+        tuple: (id, visit_date, item_id) rows
+    """
+    cursor = history_cursor(devotee_pk, after) if after is not None else None
+    remaining = limit
+    
+    first_day = start
+    if cursor is not None and cursor[0] is not None:
+        first_day = max(start, cursor[0].date()) if start is not None else cursor[0].date()
+    for table, archived in archived_visit_tables(first_day, end):
+        query = visit_history_query(
+            devotee_pk, after=cursor, start=start, end=end, table=table
+        ).filter(archived).limit(remaining)
+        for row in query.yield_per(batch_size):
+            yield row
+            if remaining is not None:
+                remaining -= 1
+        if remaining == 0:
+            return
+    
+    query = visit_history_query(devotee_pk, after=cursor, start=start, end=end, limit=remaining)
+    yield from query.yield_per(batch_size)
@@ -0,0 +1,44 @@
+"""
+Production WSGI entry point
+
+Create the database once, then start a multi-worker server on wsgi:app:
+
+    flask --app app init-db
+    gunicorn --preload --workers 4 --threads 4 --bind 0.0.0.0:5000 wsgi:app
+    waitress-serve --threads 8 --port 5000 wsgi:app    (Windows)
+
+Unless WARM_CACHES is set, importing this module does no database work
+and boot time is the Flask and SQLAlchemy imports; with --preload gunicorn
+pays it once and forks the workers from the loaded app. The print spooler
+is not started here, run `flask --app app print-spooler` as a separate
+process.
+"""
+
+import logging
+import time
+
+started = time.perf_counter()
+
+from app import create_app
+
+app = create_app()
+
+# Build or load the static bundles once, before the workers are forked
+from utils.assets import asset_manifest
+asset_manifest.files(app.static_folder)
+
+if app.config['WARM_CACHES']:
+    # Loaded before gunicorn --preload forks, the caches are shared by the workers
+    from database import db_session, engine
+    from utils.devotee_index import devotee_index
+    from utils.item_catalog import item_catalog
+    
+    item_catalog.load()
+    devotee_index.load()
+    db_session.remove()
+    # Forked workers must not share the connections opened here
+    engine.dispose()
+
+app.config['BOOT_SECONDS'] = round(time.perf_counter() - started, 4)
+
+logging.getLogger(__name__).info(f"Worker booted in {app.config['BOOT_SECONDS'] * 1000:.0f} ms")